@@ -1,14 +1,31 @@
+import asyncio
 import dataclasses
 from pathlib import Path
 import sys
+import time
 
+from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 import gradio as gr
+import httpx
+from loguru import logger
 import ollama
 from ollama import Image
 from ollama import Message
+import uvicorn
 
 sys.path.append(str(Path()))
 
+from rag.domain.chunks import EmbeddedVideoCaptionChunk
+from rag.domain.chunks import EmbeddedVideoFrameChunk
+from rag.infrastructure.concurrency import StageOverloadedError
+from rag.infrastructure.concurrency import stage_limiter
+from rag.infrastructure.embedding_cache import CachedEmbedding
+from rag.infrastructure.embeddings import BGEEmbedding
+from rag.infrastructure.metrics import metrics
+from rag.infrastructure.registry import lazy
+from rag.infrastructure.registry import warm_up
+from rag.infrastructure.response_cache import ResponseCache
 from rag.infrastructure.retriever import ContextRetriever
 from rag.settings import settings
 from rag.utils import get_video_clip
@@ -16,8 +33,18 @@ from rag.utils import get_video_clip
 gr.set_static_paths(paths=[Path.cwd().absolute() / "temp"])
 
 MODEL_NAME = ""
-ollama_client = ollama.Client()
-retriever = ContextRetriever()
+# Keeps connections to Ollama alive across requests, one per concurrent generation
+ollama_client = lazy(
+    "ollama_client",
+    lambda: ollama.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=settings.GENERATION_CONCURRENCY,
+            max_keepalive_connections=settings.GENERATION_CONCURRENCY,
+        )
+    ),
+)
+retriever = lazy("retriever", ContextRetriever)
+response_cache = lazy("response_cache", ResponseCache)
 
 
 class ChatMessage(Message):
@@ -49,9 +76,39 @@ class ChatbotInstance:
         self.history.append(ChatMessage(role="user", content=content))
         return self.to_gradio_chat_message(), ""
 
-    def request_response(self):
+    def is_first_question(self) -> bool:
+        return sum(message.role == "user" and not message.is_context for message in self.history) == 1
+
+    def lookup_cached_response(self, query: str):
+        """
+        Find the answer to a near-identical previous question, with its context.
+        :param query: The question of the user.
+        :return: The cached response with its caption and frame chunks, or None.
+        """
+        # Follow-up questions depend on the conversation, so only the first question of a chat is answered from cache
+        if not settings.RESPONSE_CACHE_ENABLED or not self.is_first_question():
+            return None
+
+        with metrics.time("response_cache_lookup"):
+            # The retriever embeds the query again, which is then served by the embedding cache
+            cached = response_cache.get(CachedEmbedding(BGEEmbedding()).embed_text(query), self.model)
+            if cached is None:
+                return None
+
+            caption_context = EmbeddedVideoCaptionChunk.find_many(cached.caption_ids)
+            image_context = EmbeddedVideoFrameChunk.find_many(cached.frame_ids)
+
+        if len(caption_context) != len(cached.caption_ids) or len(image_context) != len(cached.frame_ids):
+            return None
+
+        logger.info(f"Answering from cache, similarity {cached.similarity:.3f} to question: {cached.query}")
+        return cached, caption_context, image_context
+
+    async def request_response(self):
         assert self.history[-1].role == "user", "Last message must be from user"
 
+        query = self.history[-1].content
+
         self.history.append(
             ChatMessage(
                 role="user",
@@ -62,23 +119,27 @@ class ChatbotInstance:
         yield self.to_gradio_chat_message()
 
         # Retrieve context
-        caption_context, image_context = retriever.retrieve_context(self.history[-1]["content"])
+        async with stage_limiter.acquire("retrieval"):
+            cached_response = await asyncio.to_thread(self.lookup_cached_response, query)
+            if cached_response is not None:
+                cached_response, caption_context, image_context = cached_response
+            else:
+                caption_context, image_context = await retriever.aretrieve_context(query)
 
-        self.history[-1].content = "\n\n".join([chunk.to_context() for chunk in caption_context])
-        self.history[-1].images = [Image(value=chunk.to_context()) for chunk in image_context]
+            self.history[-1].content = "\n\n".join([chunk.to_context() for chunk in caption_context])
+            with metrics.time("frame_fetch"):
+                self.history[-1].images = [
+                    Image(value=context)
+                    for context in await asyncio.to_thread(EmbeddedVideoFrameChunk.bulk_to_context, image_context)
+                ]
         yield self.to_gradio_chat_message()
 
-        self.history.append(ChatMessage(role="assistant", content=""))
-        response = ollama_client.chat(
-            model=self.model,
-            messages=self.history[:-1],
-            stream=True,
-        )
-
-        for chunk in response:
-            if chunk.message.role == "assistant":
-                self.history[-1].content += chunk.message.content
-                yield self.to_gradio_chat_message()
+        if cached_response is not None:
+            self.history.append(ChatMessage(role="assistant", content=cached_response.answer))
+            yield self.to_gradio_chat_message()
+        else:
+            async for messages in self.generate_response(query, caption_context, image_context):
+                yield messages
 
         # Process video clip
         video_id = caption_context[0].video_id
@@ -92,19 +153,65 @@ class ChatbotInstance:
             )
         )
         yield self.to_gradio_chat_message()
-        video_clip_path = get_video_clip(video_id, start_ms, end_ms)
-        self.history[
-            -1
-        ].content = f"<video src='/gradio_api/file={video_clip_path}#t={start_ms//1000},{end_ms//1000}' controls width='640' height='360'></video>"
+        with metrics.time("clip_extraction"):
+            video_clip_path, clip_start_ms = await asyncio.to_thread(get_video_clip, video_id, start_ms, end_ms)
+        # The clip starts at the keyframe before the retrieved span, so the fragment skips to the span within it
+        fragment = f"#t={(start_ms - clip_start_ms) / 1000:.3f},{(end_ms - clip_start_ms) / 1000:.3f}"
+        video_src = f"/gradio_api/file={video_clip_path}{fragment}"
+        self.history[-1].content = f"<video src='{video_src}' controls width='640' height='360'></video>"
         yield self.to_gradio_chat_message()
 
+    async def generate_response(
+        self,
+        query: str,
+        caption_context: list[EmbeddedVideoCaptionChunk],
+        image_context: list[EmbeddedVideoFrameChunk],
+    ):
+        async with stage_limiter.acquire("generation"):
+            self.history.append(ChatMessage(role="assistant", content=""))
+            generation_start = time.perf_counter()
+            first_token_received = False
+            response = await ollama_client.chat(
+                model=self.model,
+                messages=self.history[:-1],
+                stream=True,
+            )
+
+            async for chunk in response:
+                if chunk.message.role == "assistant":
+                    if not first_token_received:
+                        metrics.observe("llm_time_to_first_token", time.perf_counter() - generation_start)
+                        first_token_received = True
+                    self.history[-1].content += chunk.message.content
+                    yield self.to_gradio_chat_message()
+            metrics.observe("llm_generation", time.perf_counter() - generation_start)
+
+        if settings.RESPONSE_CACHE_ENABLED and self.is_first_question():
+            await asyncio.to_thread(
+                response_cache.put,
+                query,
+                await asyncio.to_thread(CachedEmbedding(BGEEmbedding()).embed_text, query),
+                self.model,
+                answer=self.history[-1].content,
+                caption_ids=[str(chunk.id) for chunk in caption_context],
+                frame_ids=[str(chunk.id) for chunk in image_context],
+                video_ids=[chunk.video_id for chunk in [*caption_context, *image_context]],
+            )
+
 
 def append_user_message(state: ChatbotInstance, message: str):
     return state.append_user_message(message)
 
 
-def chat(state: ChatbotInstance):
-    yield from state.request_response()
+async def chat(state: ChatbotInstance):
+    history_length = len(state.history)
+    try:
+        async for messages in state.request_response():
+            yield messages
+    except StageOverloadedError as e:
+        # Drop the partial answer, so the question can be asked again
+        del state.history[history_length:]
+        raise gr.Error("Too many questions are being answered right now, please try again in a moment.") from e
 
 
 def get_chatbot_instance():
@@ -115,14 +222,35 @@ def get_chatbot_instance():
 
 
 with gr.Blocks() as demo:
-    # State
-    instance = get_chatbot_instance()
-    state = gr.State(instance)
+    # State, created for each session
+    state = gr.State(get_chatbot_instance)
 
     gr.Markdown("# Video RAG")
     chatbot = gr.Chatbot(type="messages")
     msg = gr.Textbox()
-    msg.submit(append_user_message, [state, msg], [chatbot, msg], queue=False).then(chat, [state], [chatbot])
+    msg.submit(append_user_message, [state, msg], [chatbot, msg], queue=False).then(
+        chat, [state], [chatbot], concurrency_limit=settings.SERVING_CONCURRENCY
+    )
+
+# Requests beyond the queue size are rejected right away instead of waiting for minutes
+demo.queue(max_size=settings.SERVING_QUEUE_SIZE)
+
+app = FastAPI()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def get_metrics():
+    return metrics.to_prometheus()
+
+
+@app.get("/metrics.json")
+def get_metrics_json():
+    return metrics.to_dict()
+
+
+app = gr.mount_gradio_app(app, demo, path="/")
 
 if __name__ == "__main__":
-    demo.launch()
+    # Load models and open connections before serving, so the first request does not pay for them
+    warm_up()
+    uvicorn.run(app, host="127.0.0.1", port=7860)
@@ -13,11 +13,12 @@ from pydantic import Field
 from pymongo import errors
 
 from rag.infrastructure.mongo import connection
+from rag.infrastructure.registry import lazy
 from rag.settings import settings
 
 T = TypeVar("T", bound="MongoBaseDocument")
 
-_database = connection.get_database(settings.MONGO_DATABASE_NAME)
+_database = lazy("mongo_database", lambda: connection.get_database(settings.MONGO_DATABASE_NAME))
 
 
 class MongoBaseDocument(BaseModel, Generic[T], ABC):
@@ -33,8 +34,16 @@ class MongoBaseDocument(BaseModel, Generic[T], ABC):
     def __hash__(self) -> int:
         return hash(self.id)
 
+    @classmethod
+    def _image_fields(cls: type[T]) -> frozenset[str]:
+        return frozenset(name for name, field in cls.model_fields.items() if field.annotation is PIL.Image.Image)
+
     @staticmethod
     def _is_base64_image(s: str) -> bool:
+        # Images were stored as base64 strings before they were stored as binary, check the prefix before decoding
+        if not s.startswith(("/9j/", "iVBORw0KGgo")):
+            return False
+
         try:
             decoded_data = base64.b64decode(s)
             if len(decoded_data) < 8:
@@ -44,18 +53,43 @@ class MongoBaseDocument(BaseModel, Generic[T], ABC):
         except Exception:
             return False
 
+    @staticmethod
+    def _decode_image(value: bytes | str) -> PIL.Image.Image:
+        # PIL only parses the header here, pixel data is decoded on first access
+        if isinstance(value, str):
+            value = base64.b64decode(value)
+
+        return PIL.Image.open(BytesIO(value))
+
+    @staticmethod
+    def encode_image(image: PIL.Image.Image) -> bytes:
+        image_format = settings.MONGO_IMAGE_FORMAT
+        if image_format == "JPEG" and image.mode not in ("RGB", "L"):
+            image = image.convert("RGB")
+
+        buffered = BytesIO()
+        image.save(buffered, format=image_format, quality=settings.MONGO_IMAGE_QUALITY)
+        return buffered.getvalue()
+
     @classmethod
-    def from_mongo(cls: type[T], data: dict) -> T:
-        """Convert "_id" (str object) into "id" (UUID object)."""
+    def from_mongo(cls: type[T], data: dict, *, partial: bool = False) -> T:
+        """Convert "_id" (str object) into "id" (UUID object).
+
+        With ``partial``, the document is built without validation, so fields left out by a projection stay unset.
+        """
 
         if not data:
             raise ValueError("Data is empty.")
 
         id = data.pop("_id")
 
-        for key, value in data.items():
-            if isinstance(value, str) and cls._is_base64_image(value):
-                data[key] = PIL.Image.open(BytesIO(base64.b64decode(value)))
+        for key in cls._image_fields():
+            value = data.get(key)
+            if isinstance(value, bytes) or (isinstance(value, str) and cls._is_base64_image(value)):
+                data[key] = cls._decode_image(value)
+
+        if partial:
+            return cls.model_construct(**dict(data, id=uuid.UUID(id)))
 
         return cls(**dict(data, id=id))
 
@@ -78,9 +112,7 @@ class MongoBaseDocument(BaseModel, Generic[T], ABC):
             if isinstance(value, uuid.UUID):
                 dict_[key] = str(value)
             if isinstance(value, PIL.Image.Image):
-                buffered = BytesIO()
-                value.save(buffered, format="PNG")
-                dict_[key] = base64.b64encode(buffered.getvalue()).decode("utf-8")
+                dict_[key] = self.encode_image(value)
 
         return dict_
 
@@ -95,6 +127,21 @@ class MongoBaseDocument(BaseModel, Generic[T], ABC):
 
             return None
 
+    def update(self: T, **fields) -> bool:
+        """Set ``fields`` on the document, both in memory and in the database."""
+        collection = _database[self.get_collection_name()]
+        try:
+            collection.update_one({"_id": str(self.id)}, {"$set": fields})
+        except errors.OperationFailure:
+            logger.error(f"Failed to update document {self.id}")
+
+            return False
+
+        for key, value in fields.items():
+            setattr(self, key, value)
+
+        return True
+
     @classmethod
     def get_or_create(cls: type[T], **filter_options) -> T:
         collection = _database[cls.get_collection_name()]
@@ -136,6 +183,50 @@ class MongoBaseDocument(BaseModel, Generic[T], ABC):
 
             return None
 
+    @classmethod
+    def find_many(cls: type[T], ids: list[str], projection: list[str] | None = None) -> list[T]:
+        """Fetch documents by id in a single query, in the order of ``ids``, skipping ids that do not exist.
+
+        With a ``projection``, only the listed fields are fetched and the documents are returned unvalidated.
+        """
+        collection = _database[cls.get_collection_name()]
+        try:
+            instances = collection.find({"_id": {"$in": list(ids)}}, projection=projection)
+            documents = {}
+            for instance in instances:
+                # from_mongo pops "_id" from the instance
+                id = instance["_id"]
+                documents[id] = cls.from_mongo(instance, partial=projection is not None)
+        except errors.OperationFailure:
+            logger.error("Failed to retrieve documents")
+
+            return []
+
+        return [documents[id] for id in ids if id in documents]
+
+    @classmethod
+    def find_images(cls: type[T], ids: list[str], field: str) -> list[bytes]:
+        """Fetch the stored images of documents by id, in the order of ``ids``, skipping ids that do not exist.
+
+        Images are returned encoded as they are stored, without decoding and re-encoding them.
+        """
+        collection = _database[cls.get_collection_name()]
+        try:
+            instances = collection.find({"_id": {"$in": list(ids)}}, projection=[field])
+            images = {}
+            for instance in instances:
+                value = instance.get(field)
+                if isinstance(value, str):
+                    value = base64.b64decode(value)
+                if value is not None:
+                    images[instance["_id"]] = value
+        except errors.OperationFailure:
+            logger.error("Failed to retrieve images")
+
+            return []
+
+        return [images[id] for id in ids if id in images]
+
     @classmethod
     def bulk_find(cls: type[T], **filter_options) -> list[T]:
         collection = _database[cls.get_collection_name()]
@@ -147,6 +238,16 @@ class MongoBaseDocument(BaseModel, Generic[T], ABC):
 
             return []
 
+    @classmethod
+    def bulk_delete(cls: type[T], **filter_options) -> int:
+        collection = _database[cls.get_collection_name()]
+        try:
+            return collection.delete_many(filter_options).deleted_count
+        except errors.OperationFailure:
+            logger.error(f"Failed to delete documents of type {cls.__name__}")
+
+            return 0
+
     @classmethod
     def get_collection_name(cls: type[T]) -> str:
         if not hasattr(cls, "Settings") or not hasattr(cls.Settings, "name"):
@@ -1,5 +1,6 @@
 from abc import ABC
 from collections.abc import Callable
+from collections.abc import Iterable
 from typing import Any
 from typing import Generic
 from typing import TypeVar
@@ -8,24 +9,39 @@ from uuid import UUID
 
 from loguru import logger
 import numpy as np
-from pydantic import UUID4
 from pydantic import BaseModel
 from pydantic import Field
 from qdrant_client.http import exceptions
+from qdrant_client.http.models import Disabled
 from qdrant_client.http.models import Distance
 from qdrant_client.http.models import VectorParams
+from qdrant_client.http.models import VectorParamsDiff
 from qdrant_client.models import CollectionInfo
+from qdrant_client.models import FieldCondition
+from qdrant_client.models import Filter
+from qdrant_client.models import FilterSelector
+from qdrant_client.models import MatchAny
+from qdrant_client.models import MatchValue
 from qdrant_client.models import PointStruct
+from qdrant_client.models import QueryRequest
+from qdrant_client.models import Range
 from qdrant_client.models import Record
+from qdrant_client.models import ScoredPoint
 
 from rag.domain.types import DataCategory
+from rag.infrastructure.qdrant import QDRANT_ERRORS
+from rag.infrastructure.qdrant import async_connection
 from rag.infrastructure.qdrant import connection
+from rag.settings import settings
 
 T = TypeVar("T", bound="QdrantBaseDocument")
 
+POINT_ID_NAMESPACE = UUID("6f0a4a53-7d0c-4c84-9b55-0d6f8e1b7a2e")
+
 
 class QdrantBaseDocument(BaseModel, Generic[T], ABC):
-    id: UUID4 = Field(default_factory=uuid.uuid4)
+    # Random by default, subclasses derive deterministic ids with ``point_id`` so re-runs overwrite their points
+    id: UUID = Field(default_factory=uuid.uuid4)
 
     def __eq__(self, value: object) -> bool:
         if not isinstance(value, self.__class__):
@@ -37,80 +53,166 @@ class QdrantBaseDocument(BaseModel, Generic[T], ABC):
         return hash(self.id)
 
     @classmethod
-    def from_record(cls: type[T], point: Record) -> T:
-        _id = UUID(point.id, version=4)
-        payload = point.payload or {}
+    def from_record(cls: type[T], point: Record | ScoredPoint, *, validate: bool = False) -> T:
+        """
+        Build a document from a point of its collection.
+
+        Points are written by ``to_point`` from validated documents, so they are loaded without validation
+        unless ``validate`` is set.
+        """
+        attributes = {**(point.payload or {}), "id": UUID(str(point.id))}
+        if "embedding" in cls.model_fields:
+            attributes["embedding"] = np.asarray(point.vector, dtype=np.float32) if point.vector else None
 
-        attributes = {
-            "id": _id,
-            **payload,
-        }
-        if cls.has_class_attribute("embedding"):
-            attributes["embedding"] = point.vector or None
+        if validate:
+            return cls(**attributes)
 
-        return cls(**attributes)
+        return cls.model_construct(**attributes)
 
     def to_point(self: T, **kwargs) -> PointStruct:
         exclude_unset = kwargs.pop("exclude_unset", False)
         by_alias = kwargs.pop("by_alias", True)
+        exclude = {"embedding", *kwargs.pop("exclude", ())}
 
-        payload = self.model_dump(exclude_unset=exclude_unset, by_alias=by_alias, **kwargs)
+        payload = self.model_dump(exclude_unset=exclude_unset, by_alias=by_alias, exclude=exclude, **kwargs)
 
-        _id = str(payload.pop("id"))
-        vector = payload.pop("embedding", {})
-        if vector and isinstance(vector, np.ndarray):
-            vector = vector.tolist()
+        _id = payload.pop("id")
+        # The vector is converted to a list in a single call, rather than element by element by pydantic
+        embedding = getattr(self, "embedding", None)
+        vector = embedding.tolist() if isinstance(embedding, np.ndarray) else embedding or {}
 
-        return PointStruct(id=_id, vector=vector, payload=payload)
+        return PointStruct.model_construct(id=_id, vector=vector, payload=payload)
 
     def model_dump(self: T, **kwargs) -> dict:
-        dict_ = super().model_dump(**kwargs)
+        # JSON mode converts UUIDs to strings while serializing, instead of walking the dumped dict afterwards
+        return super().model_dump(mode=kwargs.pop("mode", "json"), **kwargs)
+
+    @classmethod
+    def bulk_insert(
+        cls: type[T],
+        documents: Iterable["QdrantBaseDocument"],
+        *,
+        batch_size: int | None = None,
+        parallel: int | None = None,
+        wait: bool | None = None,
+    ) -> bool:
+        """
+        Upsert documents, streaming them to Qdrant in batches.
+
+        Failed batches are retried individually up to ``settings.QDRANT_UPLOAD_MAX_RETRIES`` times. Arguments
+        left to None default to the ``QDRANT_UPLOAD_*`` settings.
+        """
+        try:
+            cls.get_or_create_collection()
+            cls._bulk_insert(
+                documents,
+                batch_size=batch_size or settings.QDRANT_UPLOAD_BATCH_SIZE,
+                parallel=parallel or settings.QDRANT_UPLOAD_PARALLEL,
+                wait=settings.QDRANT_UPLOAD_WAIT if wait is None else wait,
+            )
+        except (RuntimeError, exceptions.ResponseHandlingException, *QDRANT_ERRORS):
+            logger.error(f"Failed to insert documents in '{cls.get_collection_name()}'.")
 
-        return self._uuid_to_str(dict_)
+            return False
+
+        return True
+
+    @classmethod
+    def _bulk_insert(
+        cls: type[T], documents: Iterable["QdrantBaseDocument"], *, batch_size: int, parallel: int, wait: bool
+    ) -> None:
+        # Points are built lazily, so only the batches in flight are held in memory
+        points = (doc.to_point() for doc in documents)
+
+        connection.upload_points(
+            collection_name=cls.get_collection_name(),
+            points=points,
+            batch_size=batch_size,
+            parallel=parallel,
+            max_retries=settings.QDRANT_UPLOAD_MAX_RETRIES,
+            wait=wait,
+        )
 
-    def _uuid_to_str(self, item: Any) -> Any:
-        if isinstance(item, dict):
-            for key, value in item.items():
-                if isinstance(value, UUID):
-                    item[key] = str(value)
-                elif isinstance(value, list):
-                    item[key] = [self._uuid_to_str(v) for v in value]
-                elif isinstance(value, dict):
-                    item[key] = {k: self._uuid_to_str(v) for k, v in value.items()}
+    @classmethod
+    def point_id(cls: type[T], *parts: Any) -> UUID:
+        """
+        Derive a deterministic point id from the parts identifying the content of a point.
+        """
+        return uuid.uuid5(POINT_ID_NAMESPACE, ":".join([cls.get_collection_name(), *map(str, parts)]))
 
-        return item
+    @classmethod
+    def build_filter(cls: type[T], **conditions: str | int | list | tuple[int | None, int | None]) -> Filter:
+        """
+        Build a filter matching all ``conditions``, keyed by field name.
+
+        A list matches any of its values, a (low, high) tuple an inclusive range with None for an open end,
+        and any other value an exact match.
+        """
+        must = []
+        for key, value in conditions.items():
+            if key not in cls.model_fields:
+                raise ValueError(f"{cls.__name__} has no field '{key}'.")
+
+            if isinstance(value, tuple):
+                low, high = value
+                must.append(FieldCondition(key=key, range=Range(gte=low, lte=high)))
+            elif isinstance(value, list):
+                must.append(FieldCondition(key=key, match=MatchAny(any=value)))
+            else:
+                must.append(FieldCondition(key=key, match=MatchValue(value=value)))
+
+        return Filter(must=must)
 
     @classmethod
-    def bulk_insert(cls: type[T], documents: list["QdrantBaseDocument"]) -> bool:
+    def bulk_delete(cls: type[T], query_filter: Filter) -> bool:
         try:
-            cls._bulk_insert(documents)
-        except exceptions.UnexpectedResponse:
-            logger.info(
-                f"Collection '{cls.get_collection_name()}' does not exist. Trying to create the collection and reinsert the documents."
+            connection.delete(
+                collection_name=cls.get_collection_name(), points_selector=FilterSelector(filter=query_filter)
             )
+        except QDRANT_ERRORS:
+            logger.error(f"Failed to delete documents in '{cls.get_collection_name()}'.")
 
-            cls.create_collection()
+            return False
 
-            try:
-                cls._bulk_insert(documents)
-            except exceptions.UnexpectedResponse:
-                logger.error(f"Failed to insert documents in '{cls.get_collection_name()}'.")
+        return True
 
-                return False
+    @classmethod
+    def find_many(cls: type[T], ids: list[str]) -> list[T]:
+        """
+        Fetch documents by id in a single request, in the order of ``ids``, skipping ids that do not exist.
+        """
+        try:
+            records = connection.retrieve(collection_name=cls.get_collection_name(), ids=ids, with_payload=True)
+        except QDRANT_ERRORS:
+            logger.error(f"Failed to retrieve documents in '{cls.get_collection_name()}'.")
 
-        return True
+            return []
+
+        return cls._in_order(ids, records)
 
     @classmethod
-    def _bulk_insert(cls: type[T], documents: list["QdrantBaseDocument"]) -> None:
-        points = [doc.to_point() for doc in documents]
+    async def async_find_many(cls: type[T], ids: list[str]) -> list[T]:
+        try:
+            records = await async_connection.retrieve(
+                collection_name=cls.get_collection_name(), ids=ids, with_payload=True
+            )
+        except QDRANT_ERRORS:
+            logger.error(f"Failed to retrieve documents in '{cls.get_collection_name()}'.")
+
+            return []
+
+        return cls._in_order(ids, records)
 
-        connection.upsert(collection_name=cls.get_collection_name(), points=points)
+    @classmethod
+    def _in_order(cls: type[T], ids: list[str], records: list[Record]) -> list[T]:
+        documents = {str(record.id): cls.from_record(record) for record in records}
+        return [documents[id] for id in ids if id in documents]
 
     @classmethod
     def bulk_find(cls: type[T], limit: int = 10, **kwargs) -> tuple[list[T], UUID | None]:
         try:
             documents, next_offset = cls._bulk_find(limit=limit, **kwargs)
-        except exceptions.UnexpectedResponse:
+        except QDRANT_ERRORS:
             logger.error(f"Failed to search documents in '{cls.get_collection_name()}'.")
 
             documents, next_offset = [], None
@@ -134,7 +236,7 @@ class QdrantBaseDocument(BaseModel, Generic[T], ABC):
         )
         documents = [cls.from_record(record) for record in records]
         if next_offset is not None:
-            next_offset = UUID(next_offset, version=4)
+            next_offset = UUID(next_offset)
 
         return documents, next_offset
 
@@ -142,7 +244,7 @@ class QdrantBaseDocument(BaseModel, Generic[T], ABC):
     def search(cls: type[T], query_vector: list, limit: int = 10, **kwargs) -> list[T]:
         try:
             documents = cls._search(query_vector=query_vector, limit=limit, **kwargs)
-        except exceptions.UnexpectedResponse:
+        except QDRANT_ERRORS:
             logger.error(f"Failed to search documents in '{cls.get_collection_name()}'.")
 
             documents = []
@@ -152,32 +254,151 @@ class QdrantBaseDocument(BaseModel, Generic[T], ABC):
     @classmethod
     def _search(cls: type[T], query_vector: list, limit: int = 10, **kwargs) -> list[T]:
         collection_name = cls.get_collection_name()
-        records = connection.search(
+        response = connection.query_points(
             collection_name=collection_name,
-            query_vector=query_vector,
+            query=query_vector,
             limit=limit,
+            search_params=kwargs.pop("search_params", cls.get_config_option("search_params")),
             with_payload=kwargs.pop("with_payload", True),
             with_vectors=kwargs.pop("with_vectors", False),
             **kwargs,
         )
-        return [cls.from_record(record) for record in records]
+        return [cls.from_record(point) for point in response.points]
 
     @classmethod
-    def get_or_create_collection(cls: type[T]) -> CollectionInfo:
+    def search_batch(
+        cls: type[T],
+        query_vectors: list[list],
+        limit: int | list[int] = 10,
+        query_filters: list[Filter | None] | None = None,
+        **kwargs,
+    ) -> list[list[T]]:
+        """
+        Search several query vectors in a single request.
+
+        ``limit`` and ``query_filters`` are either shared by all queries or given per query. Returns the
+        documents found for each query, in the order of ``query_vectors``.
+        """
+        try:
+            documents = cls._search_batch(query_vectors, limit=limit, query_filters=query_filters, **kwargs)
+        except QDRANT_ERRORS:
+            logger.error(f"Failed to search documents in '{cls.get_collection_name()}'.")
+
+            documents = [[] for _ in query_vectors]
+
+        return documents
+
+    @classmethod
+    def _search_batch(
+        cls: type[T],
+        query_vectors: list[list],
+        limit: int | list[int] = 10,
+        query_filters: list[Filter | None] | None = None,
+        **kwargs,
+    ) -> list[list[T]]:
+        responses = connection.query_batch_points(
+            collection_name=cls.get_collection_name(),
+            requests=cls._query_requests(query_vectors, limit=limit, query_filters=query_filters, **kwargs),
+        )
+        return [[cls.from_record(point) for point in response.points] for response in responses]
+
+    @classmethod
+    def _query_requests(
+        cls: type[T],
+        query_vectors: list[list],
+        limit: int | list[int] = 10,
+        query_filters: list[Filter | None] | None = None,
+        **kwargs,
+    ) -> list[QueryRequest]:
+        limits = limit if isinstance(limit, list) else [limit] * len(query_vectors)
+        query_filters = query_filters if query_filters is not None else [None] * len(query_vectors)
+        search_params = kwargs.pop("search_params", cls.get_config_option("search_params"))
+        with_payload = kwargs.pop("with_payload", True)
+        with_vectors = kwargs.pop("with_vectors", False)
+
+        return [
+            QueryRequest(
+                query=query_vector.tolist() if isinstance(query_vector, np.ndarray) else query_vector,
+                filter=query_filter,
+                limit=query_limit,
+                params=search_params,
+                with_payload=with_payload,
+                with_vector=with_vectors,
+                **kwargs,
+            )
+            for query_vector, query_filter, query_limit in zip(query_vectors, query_filters, limits, strict=True)
+        ]
+
+    @classmethod
+    async def async_search(cls: type[T], query_vector: list, limit: int = 10, **kwargs) -> list[T]:
+        try:
+            documents = await cls._async_search(query_vector=query_vector, limit=limit, **kwargs)
+        except QDRANT_ERRORS:
+            logger.error(f"Failed to search documents in '{cls.get_collection_name()}'.")
+
+            documents = []
+
+        return documents
+
+    @classmethod
+    async def _async_search(cls: type[T], query_vector: list, limit: int = 10, **kwargs) -> list[T]:
         collection_name = cls.get_collection_name()
+        response = await async_connection.query_points(
+            collection_name=collection_name,
+            query=query_vector,
+            limit=limit,
+            search_params=kwargs.pop("search_params", cls.get_config_option("search_params")),
+            with_payload=kwargs.pop("with_payload", True),
+            with_vectors=kwargs.pop("with_vectors", False),
+            **kwargs,
+        )
+        return [cls.from_record(point) for point in response.points]
 
+    @classmethod
+    async def async_search_batch(
+        cls: type[T],
+        query_vectors: list[list],
+        limit: int | list[int] = 10,
+        query_filters: list[Filter | None] | None = None,
+        **kwargs,
+    ) -> list[list[T]]:
         try:
-            return connection.get_collection(collection_name=collection_name)
-        except exceptions.UnexpectedResponse:
+            documents = await cls._async_search_batch(query_vectors, limit=limit, query_filters=query_filters, **kwargs)
+        except QDRANT_ERRORS:
+            logger.error(f"Failed to search documents in '{cls.get_collection_name()}'.")
+
+            documents = [[] for _ in query_vectors]
+
+        return documents
+
+    @classmethod
+    async def _async_search_batch(
+        cls: type[T],
+        query_vectors: list[list],
+        limit: int | list[int] = 10,
+        query_filters: list[Filter | None] | None = None,
+        **kwargs,
+    ) -> list[list[T]]:
+        responses = await async_connection.query_batch_points(
+            collection_name=cls.get_collection_name(),
+            requests=cls._query_requests(query_vectors, limit=limit, query_filters=query_filters, **kwargs),
+        )
+        return [[cls.from_record(point) for point in response.points] for response in responses]
+
+    @classmethod
+    def get_or_create_collection(cls: type[T]) -> CollectionInfo:
+        collection_name = cls.get_collection_name()
+
+        if not connection.collection_exists(collection_name=collection_name):
             use_vector_index = cls.get_use_vector_index()
 
             collection_created = cls._create_collection(
                 collection_name=collection_name, use_vector_index=use_vector_index
             )
             if collection_created is False:
-                raise RuntimeError(f"Couldn't create collection {collection_name}") from None
+                raise RuntimeError(f"Couldn't create collection {collection_name}")
 
-            return connection.get_collection(collection_name=collection_name)
+        return connection.get_collection(collection_name=collection_name)
 
     @classmethod
     def create_collection(cls: type[T]) -> bool:
@@ -189,11 +410,66 @@ class QdrantBaseDocument(BaseModel, Generic[T], ABC):
     @classmethod
     def _create_collection(cls, collection_name: str, *, use_vector_index: bool = True) -> bool:
         if use_vector_index is True:
-            vectors_config = VectorParams(size=cls.Config.embedding_size, distance=Distance.COSINE)
+            vectors_config = VectorParams(
+                size=cls.Config.embedding_size,
+                distance=Distance.COSINE,
+                on_disk=cls.get_config_option("on_disk"),
+            )
         else:
             vectors_config = {}
 
-        return connection.create_collection(collection_name=collection_name, vectors_config=vectors_config)
+        collection_created = connection.create_collection(
+            collection_name=collection_name,
+            vectors_config=vectors_config,
+            hnsw_config=cls.get_config_option("hnsw_config"),
+            quantization_config=cls.get_config_option("quantization_config"),
+        )
+        if collection_created:
+            cls._create_payload_indexes(collection_name, existing=set())
+
+        return collection_created
+
+    @classmethod
+    def _create_payload_indexes(cls, collection_name: str, existing: set[str]) -> None:
+        for field_name, field_schema in cls.get_config_option("payload_indexes", {}).items():
+            if field_name not in existing:
+                connection.create_payload_index(
+                    collection_name=collection_name, field_name=field_name, field_schema=field_schema
+                )
+
+    @classmethod
+    def migrate_collection(cls: type[T]) -> None:
+        """
+        Apply the HNSW, quantization, on-disk and payload index options of ``Config`` to an existing collection.
+
+        Only options that differ from the collection's are updated, so this is cheap to run on every start.
+        Qdrant rebuilds the index and the quantized vectors in the background.
+        """
+        collection_name = cls.get_collection_name()
+        info = cls.get_or_create_collection()
+
+        update = {}
+        hnsw_config = cls.get_config_option("hnsw_config")
+        if hnsw_config is not None and any(
+            getattr(info.config.hnsw_config, key) != value
+            for key, value in hnsw_config.model_dump(exclude_none=True).items()
+        ):
+            update["hnsw_config"] = hnsw_config
+
+        quantization_config = cls.get_config_option("quantization_config")
+        if quantization_config != info.config.quantization_config:
+            update["quantization_config"] = quantization_config or Disabled.DISABLED
+
+        on_disk = bool(cls.get_config_option("on_disk"))
+        vectors = info.config.params.vectors
+        if isinstance(vectors, VectorParams) and bool(vectors.on_disk) != on_disk:
+            update["vectors_config"] = {"": VectorParamsDiff(on_disk=on_disk)}
+
+        if update:
+            logger.info(f"Updating the {', '.join(update)} of collection '{collection_name}'.")
+            connection.update_collection(collection_name=collection_name, **update)
+
+        cls._create_payload_indexes(collection_name, existing=set(info.payload_schema))
 
     @classmethod
     def get_category(cls: type[T]) -> DataCategory:
@@ -214,6 +490,13 @@ class QdrantBaseDocument(BaseModel, Generic[T], ABC):
 
         return cls.Config.name
 
+    @classmethod
+    def get_config_option(cls: type[T], name: str, default: Any = None) -> Any:
+        if not hasattr(cls, "Config"):
+            return default
+
+        return getattr(cls.Config, name, default)
+
     @classmethod
     def get_use_vector_index(cls: type[T]) -> bool:
         if not hasattr(cls, "Config") or not hasattr(cls.Config, "use_vector_index"):
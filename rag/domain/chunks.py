@@ -1,19 +1,40 @@
 from abc import ABC
+from typing import ClassVar
 from typing import TypeVar
 
+from pydantic import ConfigDict
 from pydantic import Field
+from qdrant_client.models import HnswConfigDiff
+from qdrant_client.models import IntegerIndexParams
+from qdrant_client.models import IntegerIndexType
+from qdrant_client.models import KeywordIndexParams
+from qdrant_client.models import KeywordIndexType
+from qdrant_client.models import QuantizationSearchParams
+from qdrant_client.models import ScalarQuantization
+from qdrant_client.models import ScalarQuantizationConfig
+from qdrant_client.models import ScalarType
+from qdrant_client.models import SearchParams
 
 from rag.domain.base.qdrant_document import QdrantBaseDocument
 from rag.domain.documents import VideoFrameDocument
 
 from .types import DataCategory
+from .types import Embedding
 
 T = TypeVar("T", bound="EmbeddedChunk")
 
+PayloadIndexParams = KeywordIndexParams | IntegerIndexParams
+
+# Points of a video are stored together, as searches are mostly restricted to a single video
+VIDEO_ID_INDEX = KeywordIndexParams(type=KeywordIndexType.KEYWORD, is_tenant=True)
+# Timestamps are only filtered by range, never by exact value
+TIMESTAMP_INDEX = IntegerIndexParams(type=IntegerIndexType.INTEGER, lookup=False, range=True)
+
 
 class EmbeddedChunk(QdrantBaseDocument[T], ABC):
+    model_config = ConfigDict(arbitrary_types_allowed=True)
     content: str
-    embedding: list[float] | None
+    embedding: Embedding | None
     video_id: str
     video_title: str
     video_height: int
@@ -33,6 +54,17 @@ class EmbeddedVideoCaptionChunk(EmbeddedChunk["EmbeddedVideoCaptionChunk"]):
     class Config:
         name = DataCategory.VIDEO
         embedding_size = 768
+        hnsw_config = HnswConfigDiff(m=16, ef_construct=100)
+        quantization_config = ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+        on_disk = False
+        payload_indexes: ClassVar[dict[str, PayloadIndexParams]] = {
+            "video_id": VIDEO_ID_INDEX,
+            "start_ms": TIMESTAMP_INDEX,
+            "end_ms": TIMESTAMP_INDEX,
+        }
+        search_params = SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=2.0))
 
     def to_context(self) -> str:
         start = self.start_ms / 1000
@@ -48,6 +80,25 @@ class EmbeddedVideoFrameChunk(EmbeddedChunk["EmbeddedVideoFrameChunk"]):
     class Config:
         name = DataCategory.VIDEO_FRAME
         embedding_size = 1152
+        hnsw_config = HnswConfigDiff(m=16, ef_construct=100)
+        # The int8 vectors stay in RAM, the original vectors are only read from disk to rescore the candidates
+        quantization_config = ScalarQuantization(
+            scalar=ScalarQuantizationConfig(type=ScalarType.INT8, quantile=0.99, always_ram=True)
+        )
+        on_disk = True
+        payload_indexes: ClassVar[dict[str, PayloadIndexParams]] = {
+            "video_id": VIDEO_ID_INDEX,
+            "frame_timestamp": TIMESTAMP_INDEX,
+        }
+        search_params = SearchParams(quantization=QuantizationSearchParams(rescore=True, oversampling=2.0))
 
     def to_context(self) -> bytes:
-        return VideoFrameDocument.find(_id=self.frame_id).frame_image.tobytes()
+        images = VideoFrameDocument.find_images([self.frame_id], "frame_image")
+        if not images:
+            raise ValueError(f"Frame {self.frame_id} of video {self.video_id} no longer exists.")
+        return images[0]
+
+    @classmethod
+    def bulk_to_context(cls, chunks: list["EmbeddedVideoFrameChunk"]) -> list[bytes]:
+        """Fetch the frames of several chunks in a single query, skipping frames that no longer exist."""
+        return VideoFrameDocument.find_images([chunk.frame_id for chunk in chunks], "frame_image")
@@ -28,5 +28,8 @@ class VideoDocument(MongoBaseDocument["VideoDocument"]):
 
     frame_ids: list[str] = Field(default_factory=list)
 
+    # Fingerprint of the content the video was last featurized from, None if it never was
+    feature_fingerprint: str | None = None
+
     class Settings:
         name = DataCategory.VIDEO
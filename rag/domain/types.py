@@ -1,5 +1,18 @@
+from typing import Annotated
+
+import numpy as np
+from pydantic import BeforeValidator
+from pydantic import PlainSerializer
 
 
 class DataCategory:
     VIDEO = "video"
     VIDEO_FRAME = "video_frame"
+
+
+# Embeddings are kept as float32 arrays, converted to lists only when serialized to JSON
+Embedding = Annotated[
+    np.ndarray,
+    BeforeValidator(lambda value: np.asarray(value, dtype=np.float32)),
+    PlainSerializer(lambda value: value.tolist(), return_type=list[float], when_used="json"),
+]
@@ -0,0 +1,214 @@
+from collections import Counter
+from pathlib import Path
+import re
+from threading import Lock
+
+from loguru import logger
+import numpy as np
+
+STOPWORDS = frozenset(
+    {
+        "a",
+        "an",
+        "and",
+        "are",
+        "as",
+        "at",
+        "be",
+        "but",
+        "by",
+        "do",
+        "for",
+        "from",
+        "has",
+        "have",
+        "i",
+        "if",
+        "in",
+        "is",
+        "it",
+        "its",
+        "of",
+        "on",
+        "or",
+        "so",
+        "that",
+        "the",
+        "then",
+        "there",
+        "these",
+        "this",
+        "to",
+        "was",
+        "we",
+        "were",
+        "what",
+        "when",
+        "which",
+        "will",
+        "with",
+        "you",
+        "your",
+    }
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return [token for token in re.findall(r"\w+", text.lower()) if token not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    Okapi BM25 index over a fixed set of documents.
+
+    The BM25 weight of every (term, document) pair is computed when the index is built and stored in a
+    term-major sparse matrix, so a query only sums the postings of its terms.
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        terms: np.ndarray,
+        indptr: np.ndarray,
+        documents: np.ndarray,
+        weights: np.ndarray,
+    ):
+        self.ids = ids
+        self.terms = terms
+        self.indptr = indptr
+        self.documents = documents
+        self.weights = weights
+        self._vocabulary = {term: i for i, term in enumerate(terms.tolist())}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(cls, ids: list[str], texts: list[str], k1: float = 1.5, b: float = 0.75) -> "BM25Index":
+        """
+        Build the index of documents.
+
+        Args:
+            ids: Ids of the documents, returned by ``search``.
+            texts: Texts of the documents, in the order of ``ids``.
+            k1: Term frequency saturation.
+            b: Document length normalization.
+
+        Returns:
+            The index.
+        """
+        term_counts = [Counter(tokenize(text)) for text in texts]
+        lengths = np.array([sum(counts.values()) for counts in term_counts], dtype=np.float32)
+        average_length = lengths.mean() if len(lengths) and lengths.mean() > 0 else 1.0
+
+        postings: dict[str, list[tuple[int, int]]] = {}
+        for document, counts in enumerate(term_counts):
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((document, count))
+
+        terms = sorted(postings)
+        indptr = np.zeros(len(terms) + 1, dtype=np.int64)
+        documents, weights = [], []
+        for i, term in enumerate(terms):
+            term_documents = np.array([document for document, _ in postings[term]], dtype=np.int32)
+            frequencies = np.array([count for _, count in postings[term]], dtype=np.float32)
+            idf = np.log(1 + (len(texts) - len(term_documents) + 0.5) / (len(term_documents) + 0.5))
+            norms = k1 * (1 - b + b * lengths[term_documents] / average_length)
+            documents.append(term_documents)
+            weights.append(idf * frequencies * (k1 + 1) / (frequencies + norms))
+            indptr[i + 1] = indptr[i] + len(term_documents)
+
+        return cls(
+            ids=np.array(ids, dtype=str),
+            terms=np.array(terms, dtype=str),
+            indptr=indptr,
+            documents=np.concatenate(documents) if documents else np.zeros(0, dtype=np.int32),
+            weights=np.concatenate(weights).astype(np.float32) if weights else np.zeros(0, dtype=np.float32),
+        )
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        """
+        Find the documents best matching the query.
+
+        Args:
+            query: The query text.
+            limit: Maximum number of documents to return.
+
+        Returns:
+            The (id, score) pairs of the documents containing a query term, best first.
+        """
+        if limit <= 0:
+            return []
+
+        scores = np.zeros(len(self.ids), dtype=np.float32)
+        for term in tokenize(query):
+            i = self._vocabulary.get(term)
+            if i is not None:
+                start, end = self.indptr[i], self.indptr[i + 1]
+                np.add.at(scores, self.documents[start:end], self.weights[start:end])
+
+        matches = np.flatnonzero(scores)
+        if len(matches) > limit:
+            matches = matches[np.argpartition(-scores[matches], limit - 1)[:limit]]
+        matches = matches[np.argsort(-scores[matches], kind="stable")]
+        return [(str(self.ids[i]), float(scores[i])) for i in matches]
+
+    def save(self, path: str | Path) -> None:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write next to the index then swap it in, so readers never load a partial index
+        temp_path = path.with_suffix(".part.npz")
+        np.savez(
+            temp_path,
+            ids=self.ids,
+            terms=self.terms,
+            indptr=self.indptr,
+            documents=self.documents,
+            weights=self.weights,
+        )
+        temp_path.replace(path)
+
+    @classmethod
+    def load(cls, path: str | Path) -> "BM25Index":
+        """
+        Load an index saved by ``save``, or an empty index if there is none.
+        """
+        path = Path(path)
+        if not path.exists():
+            logger.warning(f"No BM25 index at {path}, lexical search finds nothing until featurization runs.")
+            return cls.build([], [])
+
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in ("ids", "terms", "indptr", "documents", "weights")})
+
+
+class BM25IndexFile:
+    """
+    BM25 index saved at ``path``, reloaded whenever the file is replaced.
+
+    The index is rebuilt by featurization, in another process, so its modification time is checked before
+    each search.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self._index: BM25Index | None = None
+        self._mtime: int | None = None
+        self._lock = Lock()
+
+    @property
+    def index(self) -> BM25Index:
+        try:
+            mtime = self.path.stat().st_mtime_ns
+        except FileNotFoundError:
+            mtime = None
+
+        if self._index is None or mtime != self._mtime:
+            with self._lock:
+                if self._index is None or mtime != self._mtime:
+                    self._index = BM25Index.load(self.path)
+                    self._mtime = mtime
+        return self._index
+
+    def search(self, query: str, limit: int = 10) -> list[tuple[str, float]]:
+        return self.index.search(query, limit)
@@ -0,0 +1,60 @@
+import asyncio
+from contextlib import asynccontextmanager
+import time
+
+from loguru import logger
+
+from rag.settings import settings
+
+from .metrics import metrics
+
+
+class StageOverloadedError(RuntimeError):
+    pass
+
+
+class StageLimiter:
+    """
+    Bounds the number of requests running each stage of the chat pipeline at once.
+
+    A request waits for a slot of the stage for at most ``timeout`` seconds and is then rejected, so that a
+    burst of requests is turned away instead of piling up behind the model servers.
+    """
+
+    def __init__(self, limits: dict[str, int], timeout: float | None = None):
+        self.limits = limits
+        self.timeout = timeout or settings.STAGE_WAIT_TIMEOUT_S
+        self._semaphores = {stage: asyncio.Semaphore(limit) for stage, limit in limits.items()}
+
+    @asynccontextmanager
+    async def acquire(self, stage: str):
+        """
+        Hold a slot of ``stage`` for the body of the context manager.
+
+        Args:
+            stage: The stage to run.
+
+        Raises:
+            StageOverloadedError: If no slot was released within the timeout.
+        """
+        semaphore = self._semaphores[stage]
+        wait_start = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.timeout)
+        except TimeoutError as e:
+            logger.warning(f"Rejected request after waiting {self.timeout}s for stage '{stage}'.")
+            raise StageOverloadedError(f"All {self.limits[stage]} slots of stage '{stage}' are busy.") from e
+        metrics.observe(f"{stage}_wait", time.perf_counter() - wait_start)
+
+        try:
+            yield
+        finally:
+            semaphore.release()
+
+
+stage_limiter = StageLimiter(
+    {
+        "retrieval": settings.RETRIEVAL_CONCURRENCY,
+        "generation": settings.GENERATION_CONCURRENCY,
+    }
+)
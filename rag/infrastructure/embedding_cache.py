@@ -0,0 +1,272 @@
+from collections import OrderedDict
+from collections.abc import Callable
+from collections.abc import Iterable
+from collections.abc import Iterator
+import hashlib
+from itertools import batched
+from pathlib import Path
+import re
+import sqlite3
+from threading import Lock
+import time
+from typing import ClassVar
+
+from loguru import logger
+import numpy as np
+import PIL.Image
+
+from rag.settings import settings
+
+
+def text_key(text: str) -> str:
+    return hashlib.sha256(b"text\0" + text.encode("utf-8")).hexdigest()
+
+
+def image_key(image: PIL.Image.Image) -> str:
+    digest = hashlib.sha256(b"image\0")
+    digest.update(f"{image.mode}:{image.width}x{image.height}\0".encode())
+    digest.update(image.tobytes())
+    return digest.hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding store for a single model.
+
+    Vectors live in a memory-mapped float32 matrix on disk, with a SQLite index mapping each
+    content hash to its row. Hot entries are additionally kept in an in-memory LRU. When the
+    disk store is full, the least recently used row is overwritten.
+
+    The store can be shared by several processes, such as the app and featurization. Writers hold
+    the SQLite write lock while they create the matrix and allocate rows.
+    """
+
+    _instances: ClassVar[dict[str, "EmbeddingCache"]] = {}
+    _instances_lock = Lock()
+
+    def __init__(
+        self,
+        model_id: str,
+        directory: str | Path | None = None,
+        max_entries: int | None = None,
+        memory_entries: int | None = None,
+    ):
+        self.model_id = model_id
+        self.directory = Path(directory or settings.EMBEDDING_CACHE_DIR) / re.sub(r"[^\w.-]", "_", model_id)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries or settings.EMBEDDING_CACHE_MAX_ENTRIES
+        self.memory_entries = memory_entries or settings.EMBEDDING_CACHE_MEMORY_ENTRIES
+
+        self._lock = Lock()
+        self._memory: OrderedDict[str, np.ndarray] = OrderedDict()
+        self._vectors: np.memmap | None = None
+        self._vectors_path = self.directory / "vectors.npy"
+        self._open_vectors()
+
+        self._index = sqlite3.connect(self.directory / "index.sqlite3", check_same_thread=False)
+        self._index.execute(
+            "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, slot INTEGER NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._index.execute("CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)")
+        self._index.commit()
+
+    @classmethod
+    def for_model(cls, model_id: str) -> "EmbeddingCache":
+        """
+        Get the shared cache of a model, opening it on first use.
+
+        Args:
+            model_id: The model whose embeddings are cached.
+
+        Returns:
+            The cache of the model.
+        """
+        with cls._instances_lock:
+            if model_id not in cls._instances:
+                cls._instances[model_id] = cls(model_id)
+            return cls._instances[model_id]
+
+    def get_many(self, keys: list[str]) -> list[np.ndarray | None]:
+        """
+        Look up embeddings by content hash.
+
+        Args:
+            keys: The content hashes to look up.
+
+        Returns:
+            The cached embeddings, with None for every key that is not cached.
+        """
+        results: list[np.ndarray | None] = [None] * len(keys)
+        with self._lock:
+            missing = {}
+            for i, key in enumerate(keys):
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    results[i] = self._memory[key]
+                else:
+                    missing.setdefault(key, []).append(i)
+
+            if not missing:
+                return results
+
+            # The matrix may have been created by another process since
+            self._open_vectors()
+            if self._vectors is None:
+                return results
+
+            placeholders = ",".join("?" * len(missing))
+            rows = self._index.execute(
+                f"SELECT key, slot FROM entries WHERE key IN ({placeholders})", list(missing)
+            ).fetchall()
+            now = time.time()
+            self._index.executemany("UPDATE entries SET accessed = ? WHERE key = ?", [(now, key) for key, _ in rows])
+            self._index.commit()
+
+            for key, slot in rows:
+                vector = np.array(self._vectors[slot])
+                self._remember(key, vector)
+                for i in missing[key]:
+                    results[i] = vector
+
+        return results
+
+    def put_many(self, keys: list[str], vectors: Iterable) -> None:
+        """
+        Store embeddings under their content hashes, evicting the least recently used rows if needed.
+
+        Args:
+            keys: The content hashes of the embedded inputs.
+            vectors: The embeddings, in the same order as ``keys``.
+        """
+        with self._lock:
+            # Holds the write lock of the index until the commit, so processes allocate distinct rows
+            self._index.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                for key, raw_vector in zip(keys, vectors, strict=True):
+                    vector = np.asarray(raw_vector, dtype=np.float32).reshape(-1)
+                    if self._vectors is None:
+                        self._create_vectors(vector.shape[0])
+                    if vector.shape[0] != self._vectors.shape[1]:
+                        raise ValueError(
+                            f"Embedding of size {vector.shape[0]} does not fit cache of '{self.model_id}' "
+                            f"with size {self._vectors.shape[1]}."
+                        )
+
+                    self._vectors[self._allocate_slot(key, now)] = vector
+                    self._remember(key, vector)
+
+                if self._vectors is not None:
+                    self._vectors.flush()
+                self._index.commit()
+            except BaseException:
+                self._index.rollback()
+                raise
+
+    def _open_vectors(self) -> None:
+        if self._vectors is None and self._vectors_path.exists():
+            self._vectors = np.lib.format.open_memmap(self._vectors_path, mode="r+")
+            self.max_entries = self._vectors.shape[0]
+
+    def _create_vectors(self, size: int) -> None:
+        # Called with the write lock of the index held, so no other process creates the matrix meanwhile
+        self._open_vectors()
+        if self._vectors is not None:
+            return
+
+        # Written next to the matrix then swapped in, so other processes never open a partial file
+        temp_path = self._vectors_path.with_suffix(".part.npy")
+        vectors = np.lib.format.open_memmap(temp_path, mode="w+", dtype=np.float32, shape=(self.max_entries, size))
+        vectors.flush()
+        del vectors
+        temp_path.replace(self._vectors_path)
+        self._open_vectors()
+
+    def _allocate_slot(self, key: str, now: float) -> int:
+        row = self._index.execute("SELECT slot FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is not None:
+            self._index.execute("UPDATE entries SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+        (count,) = self._index.execute("SELECT COUNT(*) FROM entries").fetchone()
+        if count < self.max_entries:
+            slot = count
+        else:
+            evicted, slot = self._index.execute("SELECT key, slot FROM entries ORDER BY accessed LIMIT 1").fetchone()
+            self._index.execute("DELETE FROM entries WHERE key = ?", (evicted,))
+            self._memory.pop(evicted, None)
+            logger.debug(f"Evicted embedding {evicted} from cache of '{self.model_id}'.")
+
+        self._index.execute("INSERT INTO entries (key, slot, accessed) VALUES (?, ?, ?)", (key, slot, now))
+        return slot
+
+    def _remember(self, key: str, vector: np.ndarray) -> None:
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_entries:
+            self._memory.popitem(last=False)
+
+
+class CachedEmbedding:
+    """
+    Wrap a ``BGEEmbedding`` or ``Siglip2Embedding`` so that previously seen inputs are served from
+    the embedding cache of its model. Embeddings are returned as float32 numpy arrays.
+    """
+
+    def __init__(self, embedding, cache: EmbeddingCache | None = None):
+        self.embedding = embedding
+        if cache is None and settings.EMBEDDING_CACHE_ENABLED:
+            cache = EmbeddingCache.for_model(embedding.model_id)
+        self.cache = cache
+
+    def embed_text(self, text: str) -> np.ndarray:
+        return next(self._embed_many([text], text_key, self._embed_one(self.embedding.embed_text), batch_size=1))
+
+    def embed_texts(self, texts: Iterable[str], batch_size: int | None = None) -> Iterator[np.ndarray]:
+        return self._embed_many(texts, text_key, self.embedding.embed_texts, batch_size)
+
+    def embed_image(self, image: PIL.Image.Image) -> np.ndarray:
+        return next(self._embed_many([image], image_key, self._embed_one(self.embedding.embed_image), batch_size=1))
+
+    def embed_images(self, images: Iterable[PIL.Image.Image], batch_size: int | None = None) -> Iterator[np.ndarray]:
+        return self._embed_many(images, image_key, self.embedding.embed_images, batch_size)
+
+    @staticmethod
+    def _embed_one(embed_fn: Callable) -> Callable[..., Iterator]:
+        # Single-item lookups go through the unbatched model call so their results match it exactly
+        return lambda items, batch_size: map(embed_fn, items)
+
+    def _embed_many(
+        self,
+        items: Iterable,
+        key_fn: Callable[[object], str],
+        embed_fn: Callable[..., Iterator],
+        batch_size: int | None,
+    ) -> Iterator[np.ndarray]:
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        if self.cache is None:
+            for vector in embed_fn(items, batch_size=batch_size):
+                yield np.asarray(vector, dtype=np.float32)
+            return
+
+        # Look up a window of several batches at once so that the misses still fill whole batches
+        for window in batched(items, batch_size * 16):
+            keys = [key_fn(item) for item in window]
+            vectors = self.cache.get_many(keys)
+            missing: dict[str, int] = {}
+            for i, vector in enumerate(vectors):
+                if vector is None:
+                    missing.setdefault(keys[i], i)
+            if missing:
+                computed = {
+                    key: np.asarray(vector, dtype=np.float32)
+                    for key, vector in zip(
+                        missing, embed_fn([window[i] for i in missing.values()], batch_size=batch_size), strict=True
+                    )
+                }
+                self.cache.put_many(list(computed), computed.values())
+                vectors = [
+                    computed[key] if vector is None else vector for key, vector in zip(keys, vectors, strict=True)
+                ]
+
+            yield from vectors
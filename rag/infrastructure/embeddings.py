@@ -1,9 +1,18 @@
+from collections.abc import Iterable
+from collections.abc import Iterator
+from itertools import batched
 from threading import Lock
 
-from sentence_transformers import SentenceTransformer
-import torch
-from transformers import AutoModel
-from transformers import AutoProcessor
+import numpy as np
+
+from rag.settings import settings
+
+from .registry import lazy
+from .registry import lazy_module
+
+sentence_transformers = lazy_module("sentence_transformers")
+torch = lazy_module("torch")
+transformers = lazy_module("transformers")
 
 
 class Siglip2Embedding:
@@ -22,8 +31,9 @@ class Siglip2Embedding:
         model_id: str = "google/siglip2-so400m-patch14-384",
     ):
         if not hasattr(self, "initialized"):
-            self.model = AutoModel.from_pretrained(model_id, device_map="auto").eval()
-            self.processor = AutoProcessor.from_pretrained(model_id, use_fast=True)
+            self.model_id = model_id
+            self.model = transformers.AutoModel.from_pretrained(model_id, device_map="auto").eval()
+            self.processor = transformers.AutoProcessor.from_pretrained(model_id, use_fast=True)
             self.initialized = True
 
     def embed_image(self, image):
@@ -50,9 +60,50 @@ class Siglip2Embedding:
         Returns:
             The embedding of the text.
         """
-        inputs = self.processor(text=[text], return_tensors="pt").to(self.model.device)
-        with torch.no_grad():
-            return self.model.get_text_features(**inputs).tolist()[0]
+        # Padded like the batches of ``embed_texts``, so that both give the same embedding of a text
+        return next(self.embed_texts([text]))
+
+    def embed_images(self, images: Iterable, batch_size: int | None = None) -> Iterator[list[float]]:
+        """
+        Embed a stream of images in batches.
+
+        Images are resized to a fixed resolution by the processor, so batches carry no padding and
+        are consumed in input order. Embeddings are yielded as soon as their batch is computed.
+
+        Args:
+            images: The images to embed, any iterable (including generators).
+            batch_size: The number of images per forward pass.
+
+        Returns:
+            An iterator over the embeddings, in input order.
+        """
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        for batch in batched(images, batch_size):
+            inputs = self.processor(images=list(batch), return_tensors="pt").to(self.model.device)
+            with torch.no_grad():
+                yield from self.model.get_image_features(**inputs).tolist()
+
+    def embed_texts(self, texts: Iterable[str], batch_size: int | None = None) -> Iterator[list[float]]:
+        """
+        Embed a stream of texts in batches.
+
+        SigLIP pools the text tower on the last position and was trained on inputs padded to
+        64 tokens, so batches are padded to that fixed length instead of being length-bucketed.
+
+        Args:
+            texts: The texts to embed, any iterable (including generators).
+            batch_size: The number of texts per forward pass.
+
+        Returns:
+            An iterator over the embeddings, in input order.
+        """
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        for batch in batched(texts, batch_size):
+            inputs = self.processor(
+                text=list(batch), padding="max_length", max_length=64, truncation=True, return_tensors="pt"
+            ).to(self.model.device)
+            with torch.no_grad():
+                yield from self.model.get_text_features(**inputs).tolist()
 
     @property
     def embedding_size(self):
@@ -81,11 +132,39 @@ class BGEEmbedding:
         self,
         model_id: str = "BAAI/bge-base-en-v1.5",
     ):
-        self.model = SentenceTransformer(model_id)
+        if not hasattr(self, "initialized"):
+            self.model_id = model_id
+            self.model = sentence_transformers.SentenceTransformer(model_id)
+            self.initialized = True
 
     def embed_text(self, text):
         return self.model.encode(text, convert_to_numpy=True)
 
+    def embed_texts(
+        self, texts: Iterable[str], batch_size: int | None = None, window_size: int | None = None
+    ) -> Iterator[np.ndarray]:
+        """
+        Embed a stream of texts in batches.
+
+        The input is consumed in windows of ``window_size`` texts. Within a window,
+        ``SentenceTransformer.encode`` sorts the texts by length before batching, so each batch
+        holds texts of similar length and padding waste stays small. Embeddings are yielded in
+        input order as soon as their window is computed, so arbitrarily long inputs never have
+        to be held in memory at once.
+
+        Args:
+            texts: The texts to embed, any iterable (including generators).
+            batch_size: The number of texts per forward pass.
+            window_size: The number of texts sorted and encoded together.
+
+        Returns:
+            An iterator over the embeddings, in input order.
+        """
+        batch_size = batch_size or settings.EMBEDDING_BATCH_SIZE
+        window_size = window_size or batch_size * 16
+        for window in batched(texts, window_size):
+            yield from self.model.encode(list(window), batch_size=batch_size, convert_to_numpy=True)
+
     @property
     def embedding_size(self):
         """
@@ -98,6 +177,10 @@ class BGEEmbedding:
         return vec.shape[0]
 
 
+lazy("siglip2_embedding", Siglip2Embedding)
+lazy("bge_embedding", BGEEmbedding)
+
+
 if __name__ == "__main__":
     embedding = Siglip2Embedding()
     # Example usage
@@ -0,0 +1,132 @@
+from collections.abc import Callable
+from contextlib import contextmanager
+from contextlib import nullcontext
+import functools
+import json
+from threading import Lock
+import time
+from typing import Any
+
+from rag.settings import settings
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_DISABLED = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self) -> list[int]:
+        cumulative, total = [], 0
+        for count in self.counts:
+            total += count
+            cumulative.append(total)
+        return cumulative
+
+
+class Metrics:
+    """
+    Per-stage latency histograms of the retrieval and chat pipeline.
+
+    When disabled, ``time`` returns a shared no-op context manager and ``timed`` returns the function
+    unchanged, so instrumented code pays no more than an attribute lookup.
+    """
+
+    def __init__(self, *, enabled: bool = True, buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.enabled = enabled
+        self.buckets = buckets
+        self._histograms: dict[str, Histogram] = {}
+        self._lock = Lock()
+
+    def observe(self, stage: str, seconds: float) -> None:
+        if not self.enabled:
+            return
+
+        with self._lock:
+            if stage not in self._histograms:
+                self._histograms[stage] = Histogram(self.buckets)
+            self._histograms[stage].observe(seconds)
+
+    def time(self, stage: str):
+        """
+        Context manager recording the wall time of its body under ``stage``.
+        """
+        if not self.enabled:
+            return _DISABLED
+
+        return self._time(stage)
+
+    @contextmanager
+    def _time(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(stage, time.perf_counter() - start)
+
+    def timed(self, stage: str, fn: Callable) -> Callable:
+        """
+        Wrap ``fn`` so that each call is recorded under ``stage``.
+        """
+        if not self.enabled:
+            return fn
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with self._time(stage):
+                return fn(*args, **kwargs)
+
+        return wrapper
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+
+    def to_dict(self) -> dict[str, dict[str, Any]]:
+        with self._lock:
+            return {
+                stage: {
+                    "count": histogram.count,
+                    "sum": histogram.sum,
+                    "mean": histogram.sum / histogram.count if histogram.count else 0.0,
+                    "buckets": dict(zip(map(str, self.buckets), histogram.cumulative_counts(), strict=True)),
+                }
+                for stage, histogram in self._histograms.items()
+            }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def to_prometheus(self, name: str = "rag_stage_duration_seconds") -> str:
+        """
+        Render the histograms in the Prometheus text exposition format.
+        """
+        lines = [
+            f"# HELP {name} Duration of retrieval and chat pipeline stages in seconds.",
+            f"# TYPE {name} histogram",
+        ]
+        with self._lock:
+            for stage, histogram in sorted(self._histograms.items()):
+                for bound, count in zip(self.buckets, histogram.cumulative_counts(), strict=True):
+                    lines.append(f'{name}_bucket{{stage="{stage}",le="{bound}"}} {count}')
+                lines.append(f'{name}_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'{name}_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'{name}_count{{stage="{stage}"}} {histogram.count}')
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics(enabled=settings.METRICS_ENABLED)
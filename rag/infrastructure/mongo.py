@@ -1,9 +1,24 @@
+import importlib.util
+
 from loguru import logger
 from pymongo import MongoClient
 from pymongo.errors import ConnectionFailure
 
 from rag.settings import settings
 
+from .registry import lazy
+
+# Python modules the wire protocol compressors depend on, zlib is built in
+_COMPRESSOR_MODULES = {"zstd": "zstandard", "snappy": "snappy"}
+
+
+def _available_compressors(compressors: str) -> list[str]:
+    return [
+        compressor
+        for compressor in compressors.split(",")
+        if compressor not in _COMPRESSOR_MODULES or importlib.util.find_spec(_COMPRESSOR_MODULES[compressor])
+    ]
+
 
 class MongoDatabaseConnector:
     _instance: MongoClient | None = None
@@ -11,16 +26,29 @@ class MongoDatabaseConnector:
     def __new__(cls, *args, **kwargs) -> MongoClient:
         if cls._instance is None:
             try:
-                cls._instance = MongoClient(settings.MONGO_DATABASE_URI)
+                # The driver monitors the servers every heartbeat and reconnects pooled connections on its own
+                cls._instance = MongoClient(
+                    settings.MONGO_DATABASE_URI,
+                    maxPoolSize=settings.MONGO_MAX_POOL_SIZE,
+                    minPoolSize=settings.MONGO_MIN_POOL_SIZE,
+                    maxIdleTimeMS=settings.MONGO_MAX_IDLE_TIME_MS,
+                    serverSelectionTimeoutMS=settings.MONGO_TIMEOUT_MS,
+                    connectTimeoutMS=settings.MONGO_TIMEOUT_MS,
+                    heartbeatFrequencyMS=settings.MONGO_HEARTBEAT_FREQUENCY_MS,
+                    compressors=_available_compressors(settings.MONGO_COMPRESSORS),
+                    readPreference=settings.MONGO_READ_PREFERENCE,
+                    retryReads=True,
+                    retryWrites=True,
+                )
+                cls._instance.admin.command("ping")
             except ConnectionFailure as e:
+                cls._instance = None
                 logger.error(f"Couldn't connect to the database: {e!s}")
                 raise
 
-        logger.info(
-            f"Connection to MongoDB with URI successful: {settings.MONGO_DATABASE_URI}"
-        )
+            logger.info(f"Connection to MongoDB with URI successful: {settings.MONGO_DATABASE_URI}")
 
         return cls._instance
 
 
-connection = MongoDatabaseConnector()
+connection = lazy("mongo", MongoDatabaseConnector)
@@ -1,9 +1,40 @@
+import grpc
+import httpx
 from loguru import logger
+from qdrant_client import AsyncQdrantClient
 from qdrant_client import QdrantClient
 from qdrant_client.http.exceptions import UnexpectedResponse
 
 from rag.settings import settings
 
+from .registry import lazy
+from .vector_store import AsyncLocalVectorStore
+from .vector_store import LocalVectorStore
+
+# Errors of requests to Qdrant, over REST and over gRPC respectively
+QDRANT_ERRORS = (UnexpectedResponse, grpc.RpcError)
+
+
+def _client_options() -> dict:
+    return {
+        "host": settings.QDRANT_DATABASE_HOST,
+        "port": settings.QDRANT_DATABASE_PORT,
+        "grpc_port": settings.QDRANT_DATABASE_GRPC_PORT,
+        "prefer_grpc": settings.QDRANT_PREFER_GRPC,
+        "timeout": settings.QDRANT_TIMEOUT,
+        # Keepalive pings detect broken channels, which gRPC then reconnects on the next call
+        "grpc_options": {
+            "grpc.keepalive_time_ms": settings.QDRANT_GRPC_KEEPALIVE_MS,
+            "grpc.keepalive_timeout_ms": settings.QDRANT_TIMEOUT * 1000,
+            "grpc.enable_retries": 1,
+        },
+        "grpc_compression": grpc.Compression.Gzip if settings.QDRANT_GRPC_COMPRESSION else None,
+        # The client keeps no REST connection alive by default, opening a new one per request
+        "limits": httpx.Limits(
+            max_connections=settings.QDRANT_POOL_SIZE, max_keepalive_connections=settings.QDRANT_POOL_SIZE
+        ),
+    }
+
 
 class QdrantDatabaseConnector:
     _instance: QdrantClient | None = None
@@ -11,10 +42,7 @@ class QdrantDatabaseConnector:
     def __new__(cls, *args, **kwargs) -> QdrantClient:
         if cls._instance is None:
             try:
-                cls._instance = QdrantClient(
-                    host=settings.QDRANT_DATABASE_HOST,
-                    port=settings.QDRANT_DATABASE_PORT,
-                )
+                cls._instance = QdrantClient(**_client_options())
 
                 uri = f"{settings.QDRANT_DATABASE_HOST}:{settings.QDRANT_DATABASE_PORT}"
 
@@ -31,4 +59,30 @@ class QdrantDatabaseConnector:
         return cls._instance
 
 
-connection = QdrantDatabaseConnector()
+class AsyncQdrantDatabaseConnector:
+    _instance: AsyncQdrantClient | None = None
+
+    def __new__(cls, *args, **kwargs) -> AsyncQdrantClient:
+        if cls._instance is None:
+            cls._instance = AsyncQdrantClient(**_client_options())
+
+        return cls._instance
+
+
+def _connect() -> QdrantClient | LocalVectorStore:
+    if settings.VECTOR_STORE == "local":
+        return LocalVectorStore(settings.VECTOR_STORE_PATH)
+
+    return QdrantDatabaseConnector()
+
+
+def _connect_async() -> AsyncQdrantClient | AsyncLocalVectorStore:
+    if settings.VECTOR_STORE == "local":
+        # Shares the store of the sync connection, so both see the same points
+        return AsyncLocalVectorStore(connection.get())
+
+    return AsyncQdrantDatabaseConnector()
+
+
+connection = lazy("qdrant", _connect)
+async_connection = lazy("qdrant_async", _connect_async)
@@ -0,0 +1,83 @@
+from collections.abc import Callable
+import importlib
+from threading import Lock
+from types import ModuleType
+
+from loguru import logger
+
+
+class LazyResource[T]:
+    """
+    Proxy to a resource (connection, dataset, model) that is created on first use.
+
+    Attribute access, indexing and calls are forwarded to the resource, so a lazy resource can stand in
+    for a module-level singleton without changing its call sites.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T]):
+        self._name = name
+        self._factory = factory
+        self._instance: T | None = None
+        self._lock = Lock()
+
+    @property
+    def is_initialized(self) -> bool:
+        return self._instance is not None
+
+    def get(self) -> T:
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    logger.debug(f"Initializing resource '{self._name}'.")
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
+
+    def __getitem__(self, key):
+        return self.get()[key]
+
+    def __call__(self, *args, **kwargs):
+        return self.get()(*args, **kwargs)
+
+
+_resources: dict[str, LazyResource] = {}
+
+
+def lazy[T](name: str, factory: Callable[[], T]) -> LazyResource[T]:
+    """
+    Register a resource to be created by ``factory`` on first use.
+
+    Args:
+        name: Unique name of the resource, used by ``warm_up``.
+        factory: Callable creating the resource.
+
+    Returns:
+        A proxy to the resource.
+    """
+    resource = LazyResource(name, factory)
+    _resources[name] = resource
+    return resource
+
+
+def lazy_module(name: str) -> LazyResource[ModuleType]:
+    """
+    Register a module to be imported on first use, for heavy libraries such as torch.
+    """
+    resource_name = f"module:{name}"
+    if resource_name in _resources:
+        return _resources[resource_name]
+
+    return lazy(resource_name, lambda: importlib.import_module(name))
+
+
+def warm_up(*names: str) -> None:
+    """
+    Create registered resources ahead of their first use.
+
+    Args:
+        names: The resources to create, all registered resources if empty.
+    """
+    for name in names or list(_resources):
+        _resources[name].get()
@@ -1,8 +1,14 @@
+from collections import OrderedDict
+from itertools import batched
 from threading import Lock
 
-import torch
-from transformers import AutoModelForSequenceClassification
-from transformers import AutoTokenizer
+from rag.settings import settings
+
+from .registry import lazy
+from .registry import lazy_module
+
+torch = lazy_module("torch")
+transformers = lazy_module("transformers")
 
 
 class Reranker:
@@ -19,10 +25,25 @@ class Reranker:
     def __init__(
         self,
         model_id: str = "BAAI/bge-reranker-v2-m3",
+        quantization: str | None = None,
     ):
-        self.tokenizer = AutoTokenizer.from_pretrained(model_id)
-        self.model = AutoModelForSequenceClassification.from_pretrained(model_id)
-        self.model.eval()
+        if not hasattr(self, "initialized"):
+            self.tokenizer = transformers.AutoTokenizer.from_pretrained(model_id)
+            self.model = transformers.AutoModelForSequenceClassification.from_pretrained(model_id)
+            self.model.eval()
+
+            quantization = quantization or settings.RERANKER_QUANTIZATION
+            if quantization == "bf16":
+                self.model = self.model.to(torch.bfloat16)
+            elif quantization == "int8":
+                # Dynamic quantization only has CPU kernels
+                self.model = torch.ao.quantization.quantize_dynamic(self.model, {torch.nn.Linear}, dtype=torch.qint8)
+            elif quantization is not None:
+                raise ValueError(f"Unsupported reranker quantization: {quantization}")
+
+            self._scores: OrderedDict[tuple[str, str], float] = OrderedDict()
+            self._scores_lock = Lock()
+            self.initialized = True
 
     def re_rank(self, query: str, contexts: list[str]):
         """
@@ -30,20 +51,69 @@ class Reranker:
         :param query: The query to re-rank the contexts for.
         :param contexts: The contexts to be re-ranked.
         """
-        pairs = [(query, context) for context in contexts]
-        inputs = self.tokenizer(
-            pairs,
-            truncation=True,
-            padding=True,
-            max_length=512,
-            return_tensors="pt",
-        )
-        with torch.no_grad():
-            logits = (
-                self.model(**inputs)
-                .logits.view(
-                    -1,
-                )
-                .float()
+        return [index for index, _ in self.rank(query, contexts)]
+
+    def rank(
+        self, query: str, contexts: list[str], ids: list[str] | None = None, top_k: int | None = None
+    ) -> list[tuple[int, float]]:
+        """
+        Rank the contexts by relevance to the query.
+        :param query: The query to rank the contexts for.
+        :param contexts: The contexts to be ranked.
+        :param ids: Stable ids of the contexts, used to cache their scores for this query.
+        :param top_k: Only return the best ``top_k`` contexts.
+        :return: The (index in contexts, score) pairs, best first.
+        """
+        scores = self.score(query, contexts, ids=ids)
+        ranking = sorted(enumerate(scores), key=lambda item: item[1], reverse=True)
+        return ranking[:top_k]
+
+    def score(self, query: str, contexts: list[str], ids: list[str] | None = None) -> list[float]:
+        """
+        Score the relevance of each context to the query.
+        :param query: The query to score the contexts for.
+        :param contexts: The contexts to be scored.
+        :param ids: Stable ids of the contexts, used to cache their scores for this query.
+        :return: The scores, in the order of contexts.
+        """
+        scores: list[float | None] = [None] * len(contexts)
+        if ids is not None:
+            with self._scores_lock:
+                for i, context_id in enumerate(ids):
+                    if (query, context_id) in self._scores:
+                        self._scores.move_to_end((query, context_id))
+                        scores[i] = self._scores[(query, context_id)]
+
+        # Sort the pairs by length so each micro-batch is padded to similar lengths
+        missing = sorted((i for i, score in enumerate(scores) if score is None), key=lambda i: len(contexts[i]))
+        for batch in batched(missing, settings.RERANKER_BATCH_SIZE):
+            inputs = self.tokenizer(
+                [(query, contexts[i]) for i in batch],
+                truncation=True,
+                padding=True,
+                max_length=512,
+                return_tensors="pt",
             )
-        return torch.argsort(logits, descending=True).tolist()
+            with torch.no_grad():
+                logits = (
+                    self.model(**inputs)
+                    .logits.view(
+                        -1,
+                    )
+                    .float()
+                )
+            for i, logit in zip(batch, logits.tolist(), strict=True):
+                scores[i] = logit
+
+        if ids is not None and missing:
+            with self._scores_lock:
+                for i in missing:
+                    self._scores[(query, ids[i])] = scores[i]
+                    self._scores.move_to_end((query, ids[i]))
+                while len(self._scores) > settings.RERANKER_CACHE_SIZE:
+                    self._scores.popitem(last=False)
+
+        return scores
+
+
+lazy("reranker", Reranker)
@@ -0,0 +1,229 @@
+import dataclasses
+import json
+from pathlib import Path
+import sqlite3
+from threading import Lock
+import time
+
+from loguru import logger
+import numpy as np
+
+from rag.settings import settings
+
+
+@dataclasses.dataclass
+class CachedResponse:
+    query: str
+    answer: str
+    caption_ids: list[str]
+    frame_ids: list[str]
+    similarity: float
+
+
+class ResponseCache:
+    """
+    Answers of previous questions, looked up by similarity of the question embeddings.
+
+    Entries are persisted in SQLite together with the videos their context came from, so that featurization,
+    running in another process, can invalidate the answers of the videos it re-featurizes. The embeddings of
+    all entries are also kept in memory and matched with a single matrix product. A candidate is only served
+    after checking that its row still exists, so invalidations by other processes are seen immediately.
+    """
+
+    def __init__(
+        self,
+        path: str | Path | None = None,
+        similarity: float | None = None,
+        ttl: float | None = None,
+        max_entries: int | None = None,
+    ):
+        self.path = Path(settings.RESPONSE_CACHE_PATH if path is None else path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.similarity = settings.RESPONSE_CACHE_SIMILARITY if similarity is None else similarity
+        self.ttl = settings.RESPONSE_CACHE_TTL_S if ttl is None else ttl
+        self.max_entries = settings.RESPONSE_CACHE_MAX_ENTRIES if max_entries is None else max_entries
+
+        self._lock = Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        self._db.execute("PRAGMA foreign_keys = ON")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "id INTEGER PRIMARY KEY, model TEXT NOT NULL, query TEXT NOT NULL, embedding BLOB NOT NULL, "
+            "answer TEXT NOT NULL, caption_ids TEXT NOT NULL, frame_ids TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS response_videos ("
+            "response_id INTEGER NOT NULL REFERENCES responses (id) ON DELETE CASCADE, video_id TEXT NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS response_videos_video_id ON response_videos (video_id)")
+        self._db.commit()
+
+        self._ids = np.zeros(0, dtype=np.int64)
+        self._models: list[str] = []
+        self._created = np.zeros(0, dtype=np.float64)
+        self._embeddings: np.ndarray | None = None
+        self._load()
+
+    def _load(self) -> None:
+        rows = self._db.execute(
+            "SELECT id, model, embedding, created FROM responses WHERE created >= ? ORDER BY id",
+            (time.time() - self.ttl,),
+        ).fetchall()
+        if not rows:
+            return
+
+        self._ids = np.array([row[0] for row in rows], dtype=np.int64)
+        self._models = [row[1] for row in rows]
+        self._embeddings = np.stack([np.frombuffer(row[2], dtype=np.float32) for row in rows])
+        self._created = np.array([row[3] for row in rows], dtype=np.float64)
+        logger.info(f"Loaded {len(rows)} cached responses from {self.path}.")
+
+    @staticmethod
+    def _normalize(embedding) -> np.ndarray:
+        embedding = np.asarray(embedding, dtype=np.float32).reshape(-1)
+        return embedding / max(float(np.linalg.norm(embedding)), 1e-12)
+
+    def get(self, query_embedding, model: str) -> CachedResponse | None:
+        """
+        Find the answer to the most similar previous question.
+
+        Args:
+            query_embedding: Embedding of the question.
+            model: The model that has to have generated the answer.
+
+        Returns:
+            The cached response, or None if no unexpired answer is similar enough.
+        """
+        embedding = self._normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            if self._embeddings is None or self._embeddings.shape[1] != embedding.shape[0]:
+                return None
+
+            similarities = self._embeddings @ embedding
+            valid = (self._created >= now - self.ttl) & (np.array(self._models) == model)
+            candidates = np.flatnonzero(valid & (similarities >= self.similarity))
+
+            stale = []
+            for i in candidates[np.argsort(-similarities[candidates], kind="stable")]:
+                row = self._db.execute(
+                    "SELECT query, answer, caption_ids, frame_ids FROM responses WHERE id = ?", (int(self._ids[i]),)
+                ).fetchone()
+                if row is None:
+                    # Invalidated by another process
+                    stale.append(int(self._ids[i]))
+                    continue
+
+                self._forget(stale)
+                return CachedResponse(
+                    query=row[0],
+                    answer=row[1],
+                    caption_ids=json.loads(row[2]),
+                    frame_ids=json.loads(row[3]),
+                    similarity=float(similarities[i]),
+                )
+
+            self._forget(stale)
+            return None
+
+    def put(
+        self,
+        query: str,
+        query_embedding,
+        model: str,
+        answer: str,
+        caption_ids: list[str],
+        frame_ids: list[str],
+        video_ids: list[str],
+    ) -> None:
+        """
+        Store the answer to a question, evicting the oldest entries if the cache is full.
+
+        Args:
+            query: The question.
+            query_embedding: Embedding of the question.
+            model: The model that generated the answer.
+            answer: The generated answer.
+            caption_ids: Ids of the caption chunks in the context of the answer.
+            frame_ids: Ids of the frame chunks in the context of the answer.
+            video_ids: Videos the context came from, whose re-featurization invalidates the answer.
+        """
+        embedding = self._normalize(query_embedding)
+        now = time.time()
+        with self._lock:
+            cursor = self._db.execute(
+                "INSERT INTO responses (model, query, embedding, answer, caption_ids, frame_ids, created) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (model, query, embedding.tobytes(), answer, json.dumps(caption_ids), json.dumps(frame_ids), now),
+            )
+            self._db.executemany(
+                "INSERT INTO response_videos (response_id, video_id) VALUES (?, ?)",
+                [(cursor.lastrowid, video_id) for video_id in dict.fromkeys(video_ids)],
+            )
+
+            expired = [
+                row_id
+                for (row_id,) in self._db.execute(
+                    "SELECT id FROM responses WHERE created < ? OR id NOT IN "
+                    "(SELECT id FROM responses ORDER BY created DESC, id DESC LIMIT ?)",
+                    (now - self.ttl, self.max_entries),
+                )
+            ]
+            self._db.executemany("DELETE FROM responses WHERE id = ?", [(row_id,) for row_id in expired])
+            self._db.commit()
+
+            if self._embeddings is None or self._embeddings.shape[1] != embedding.shape[0]:
+                self._embeddings = embedding[None, :]
+                self._ids = np.array([cursor.lastrowid], dtype=np.int64)
+                self._models = [model]
+                self._created = np.array([now], dtype=np.float64)
+            else:
+                self._embeddings = np.vstack([self._embeddings, embedding])
+                self._ids = np.append(self._ids, cursor.lastrowid)
+                self._models.append(model)
+                self._created = np.append(self._created, now)
+            self._forget(expired)
+
+    def invalidate_videos(self, video_ids: list[str]) -> int:
+        """
+        Drop the answers whose context came from any of the videos.
+
+        Returns:
+            The number of dropped answers.
+        """
+        if not video_ids:
+            return 0
+
+        placeholders = ",".join("?" * len(video_ids))
+        with self._lock:
+            invalidated = [
+                row_id
+                for (row_id,) in self._db.execute(
+                    f"SELECT DISTINCT response_id FROM response_videos WHERE video_id IN ({placeholders})",
+                    list(video_ids),
+                )
+            ]
+            self._db.executemany("DELETE FROM responses WHERE id = ?", [(row_id,) for row_id in invalidated])
+            self._db.commit()
+            self._forget(invalidated)
+
+        if invalidated:
+            logger.info(f"Invalidated {len(invalidated)} cached responses of {len(video_ids)} videos.")
+        return len(invalidated)
+
+    def video_ids(self) -> set[str]:
+        """
+        Videos the context of any cached answer came from.
+        """
+        with self._lock:
+            return {video_id for (video_id,) in self._db.execute("SELECT DISTINCT video_id FROM response_videos")}
+
+    def _forget(self, row_ids: list[int]) -> None:
+        if not row_ids or self._embeddings is None:
+            return
+
+        keep = ~np.isin(self._ids, row_ids)
+        self._ids = self._ids[keep]
+        self._embeddings = self._embeddings[keep]
+        self._created = self._created[keep]
+        self._models = [model for model, kept in zip(self._models, keep, strict=True) if kept]
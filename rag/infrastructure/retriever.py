@@ -1,32 +1,130 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+import threading
+
 from ..domain.chunks import EmbeddedVideoCaptionChunk
 from ..domain.chunks import EmbeddedVideoFrameChunk
 from ..infrastructure.reranker import Reranker
+from ..settings import settings
+from .bm25 import BM25IndexFile
+from .embedding_cache import CachedEmbedding
 from .embeddings import BGEEmbedding
 from .embeddings import Siglip2Embedding
+from .metrics import metrics
+from .registry import lazy
+
+caption_index = lazy("caption_index", lambda: BM25IndexFile(settings.BM25_INDEX_PATH))
+
+
+def reciprocal_rank_fusion(rankings: list[list[str]], k: int | None = None) -> list[str]:
+    """
+    Fuse rankings by summing 1 / (k + rank) over the rankings each id appears in.
+    :param rankings: Ids, best first, of each ranking.
+    :param k: Dampens the weight of the top ranks, defaults to ``settings.RRF_K``.
+    :return: The ids of all rankings, best first.
+    """
+    k = k or settings.RRF_K
+    scores: dict[str, float] = {}
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            scores[item] = scores.get(item, 0.0) + 1 / (k + rank)
+
+    return sorted(scores, key=scores.get, reverse=True)
 
 
 class ContextRetriever:
+    def __init__(self, max_workers: int = 4):
+        # Model inference runs in the thread pool, Qdrant requests on a dedicated event loop, so the async
+        # Qdrant client is always used from the same loop whichever thread or loop the caller is on
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="retriever")
+        self._loop = asyncio.new_event_loop()
+        threading.Thread(target=self._loop.run_forever, name="retriever-loop", daemon=True).start()
+
     def retrieve_context(self, query: str):
         """
         Retrieve context for the given query.
         :param query: The query to retrieve context for.
         :return: The retrieved context.
         """
-        emb = BGEEmbedding().embed_text(query)
-        img_emb = Siglip2Embedding().embed_text(query)
-        caption_chunks = EmbeddedVideoCaptionChunk.search(
-            emb,
-            limit=5,
+        with metrics.time("retrieval"):
+            return asyncio.run_coroutine_threadsafe(self._retrieve_context(query), self._loop).result()
+
+    async def aretrieve_context(self, query: str):
+        """
+        Retrieve context for the given query without blocking the caller's event loop.
+        :param query: The query to retrieve context for.
+        :return: The retrieved context.
+        """
+        with metrics.time("retrieval"):
+            return await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self._retrieve_context(query), self._loop)
+            )
+
+    async def _retrieve_context(self, query: str):
+        loop = asyncio.get_running_loop()
+
+        # Both query embeddings are computed in parallel
+        emb = loop.run_in_executor(
+            self._executor, metrics.timed("text_query_embedding", CachedEmbedding(BGEEmbedding()).embed_text), query
         )
-        # Rerank the caption chunks
-        rerank_mapping = Reranker().re_rank(query, [chunk.content for chunk in caption_chunks])
-        caption_chunks = [caption_chunks[i] for i in rerank_mapping]
-        highest_mention_video_id = caption_chunks[0].video_id
+        img_emb = loop.run_in_executor(
+            self._executor,
+            metrics.timed("image_query_embedding", CachedEmbedding(Siglip2Embedding()).embed_text),
+            query,
+        )
+
+        if settings.HYBRID_SEARCH_ENABLED:
+            lexical_search = loop.run_in_executor(
+                self._executor,
+                metrics.timed("lexical_search", caption_index.search),
+                query,
+                settings.HYBRID_SEARCH_LIMIT,
+            )
+
+        emb = await emb
+        with metrics.time("caption_search"):
+            caption_chunks = await EmbeddedVideoCaptionChunk.async_search(
+                emb,
+                limit=settings.HYBRID_SEARCH_LIMIT if settings.HYBRID_SEARCH_ENABLED else settings.RETRIEVAL_CANDIDATES,
+            )
+
+        if settings.HYBRID_SEARCH_ENABLED:
+            lexical_ids = [chunk_id for chunk_id, _ in await lexical_search]
+            fused_ids = reciprocal_rank_fusion([[str(chunk.id) for chunk in caption_chunks], lexical_ids])
+            fused_ids = fused_ids[: settings.RETRIEVAL_CANDIDATES]
 
-        image_chunks = EmbeddedVideoFrameChunk.search(
-            img_emb, limit=1, query_filter={"must": [{"key": "video_id", "match": {"value": highest_mention_video_id}}]}
+            # Chunks only found by the lexical search are fetched by id
+            chunks_by_id = {str(chunk.id): chunk for chunk in caption_chunks}
+            missing_ids = [chunk_id for chunk_id in fused_ids if chunk_id not in chunks_by_id]
+            if missing_ids:
+                for chunk in await EmbeddedVideoCaptionChunk.async_find_many(missing_ids):
+                    chunks_by_id[str(chunk.id)] = chunk
+            caption_chunks = [chunks_by_id[chunk_id] for chunk_id in fused_ids if chunk_id in chunks_by_id]
+
+        # Rerank the caption chunks, while speculatively searching the frames of every candidate video in one request
+        ranking = loop.run_in_executor(
+            self._executor,
+            metrics.timed("rerank", partial(Reranker().rank, ids=[str(chunk.id) for chunk in caption_chunks])),
+            query,
+            [chunk.content for chunk in caption_chunks],
+        )
+        img_emb = await img_emb
+        video_ids = list(dict.fromkeys(chunk.video_id for chunk in caption_chunks))
+        frame_search = asyncio.ensure_future(
+            EmbeddedVideoFrameChunk.async_search_batch(
+                [img_emb] * len(video_ids),
+                limit=1,
+                query_filters=[EmbeddedVideoFrameChunk.build_filter(video_id=video_id) for video_id in video_ids],
+            )
         )
 
+        caption_chunks = [caption_chunks[i] for i, _ in await ranking]
+        highest_mention_video_id = caption_chunks[0].video_id
+
+        with metrics.time("frame_search_wait"):
+            image_chunks = (await frame_search)[video_ids.index(highest_mention_video_id)]
+
         merged_caption_chunks: list[EmbeddedVideoCaptionChunk] = []
         caption_chunks.sort(key=lambda x: x.start_ms)
 
@@ -0,0 +1,688 @@
+from bisect import bisect_left
+from collections.abc import Iterable
+from itertools import batched
+import json
+from pathlib import Path
+import shutil
+import sqlite3
+from threading import RLock
+from typing import Any
+
+import httpx
+from loguru import logger
+import numpy as np
+from pydantic import TypeAdapter
+from qdrant_client.http.exceptions import UnexpectedResponse
+from qdrant_client.http.models import CollectionConfig
+from qdrant_client.http.models import CollectionInfo
+from qdrant_client.http.models import CollectionParams
+from qdrant_client.http.models import CollectionStatus
+from qdrant_client.http.models import CountResult
+from qdrant_client.http.models import Distance
+from qdrant_client.http.models import FieldCondition
+from qdrant_client.http.models import Filter
+from qdrant_client.http.models import FilterSelector
+from qdrant_client.http.models import HasIdCondition
+from qdrant_client.http.models import HnswConfig
+from qdrant_client.http.models import HnswConfigDiff
+from qdrant_client.http.models import MatchAny
+from qdrant_client.http.models import MatchValue
+from qdrant_client.http.models import PayloadIndexInfo
+from qdrant_client.http.models import PayloadSchemaType
+from qdrant_client.http.models import PointIdsList
+from qdrant_client.http.models import PointStruct
+from qdrant_client.http.models import QuantizationConfig
+from qdrant_client.http.models import QueryRequest
+from qdrant_client.http.models import QueryResponse
+from qdrant_client.http.models import Range
+from qdrant_client.http.models import Record
+from qdrant_client.http.models import ScoredPoint
+from qdrant_client.http.models import VectorParams
+from qdrant_client.http.models import VectorParamsDiff
+
+INITIAL_CAPACITY = 1024
+DEFAULT_HNSW_CONFIG = {"m": 16, "ef_construct": 100, "full_scan_threshold": 10_000}
+KEYWORD_INDEX_TYPES = {"keyword", "uuid"}
+RANGE_INDEX_TYPES = {"integer", "float", "datetime"}
+
+_quantization_config = TypeAdapter(QuantizationConfig | None)
+
+
+def _not_found(collection_name: str) -> UnexpectedResponse:
+    return UnexpectedResponse(
+        status_code=404,
+        reason_phrase="Not Found",
+        content=f"Collection '{collection_name}' doesn't exist.".encode(),
+        headers=httpx.Headers(),
+    )
+
+
+def _index_type(field_schema: Any) -> str:
+    schema_type = getattr(field_schema, "type", field_schema)
+    return str(getattr(schema_type, "value", schema_type))
+
+
+def _values(value: Any) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+class _LocalCollection:
+    """
+    Points of a single collection, searched exactly by a matrix product.
+
+    Vectors live in a float32 matrix, memory-mapped from disk when the store is persistent, with a SQLite
+    table holding the id and payload of each row. Keyword payload indexes map each value to its rows and
+    range payload indexes are kept as float columns, other fields are filtered by scanning the payloads.
+
+    A persistent collection is reloaded by ``refresh`` when another process has written to it.
+    """
+
+    def __init__(self, directory: Path | None, config: dict):
+        self.directory = directory
+        self.config = config
+        self.lock = RLock()
+
+        size = config["size"]
+        self._ids: list[str | None] = []
+        self._payloads: list[dict | None] = []
+        self._slots: dict[str, int] = {}
+        self._free: list[int] = []
+        self._alive = np.zeros(INITIAL_CAPACITY, dtype=bool)
+        self._keyword_indexes: dict[str, dict[Any, set[int]]] = {}
+        self._range_indexes: dict[str, np.ndarray] = {}
+        self._stamp: tuple | None = None
+
+        if directory is None:
+            self._vectors = np.zeros((INITIAL_CAPACITY, size), dtype=np.float32)
+            self._points = sqlite3.connect(":memory:", check_same_thread=False)
+        else:
+            directory.mkdir(parents=True, exist_ok=True)
+            vectors_path = directory / "vectors.npy"
+            if vectors_path.exists():
+                self._vectors = np.lib.format.open_memmap(vectors_path, mode="r+")
+            else:
+                self._vectors = np.lib.format.open_memmap(
+                    vectors_path, mode="w+", dtype=np.float32, shape=(INITIAL_CAPACITY, size)
+                )
+            self._points = sqlite3.connect(directory / "points.sqlite3", check_same_thread=False)
+
+        self._points.execute(
+            "CREATE TABLE IF NOT EXISTS points (id TEXT PRIMARY KEY, slot INTEGER NOT NULL, payload TEXT NOT NULL)"
+        )
+        self._points.commit()
+        self._load()
+
+    def _load(self) -> None:
+        rows = self._points.execute("SELECT id, slot, payload FROM points").fetchall()
+        self._slots = {}
+        self._keyword_indexes = {}
+        self._range_indexes = {}
+        slot_count = max((slot for _, slot, _ in rows), default=-1) + 1
+        self._ids = [None] * slot_count
+        self._payloads = [None] * slot_count
+        self._alive = np.zeros(max(len(self._vectors), slot_count), dtype=bool)
+        for point_id, slot, payload in rows:
+            self._ids[slot] = point_id
+            self._payloads[slot] = json.loads(payload)
+            self._slots[point_id] = slot
+            self._alive[slot] = True
+        self._free = [slot for slot in range(slot_count) if self._ids[slot] is None]
+
+        for field_name, index_type in self.config["payload_indexes"].items():
+            self._build_index(field_name, index_type)
+        self._stamp = self._file_stamp()
+
+    def _file_stamp(self) -> tuple | None:
+        # The data version of SQLite changes with each commit of another connection, growing the matrix
+        # replaces its file
+        if self.directory is None:
+            return None
+
+        (data_version,) = self._points.execute("PRAGMA data_version").fetchone()
+        vectors = (self.directory / "vectors.npy").stat()
+        config_path = self.directory / "collection.json"
+        config_mtime = config_path.stat().st_mtime_ns if config_path.exists() else None
+        return data_version, vectors.st_ino, config_mtime
+
+    def refresh(self) -> None:
+        """
+        Reload the collection if another process wrote to its files since it was loaded or last written.
+        """
+        if self.directory is None or self._file_stamp() == self._stamp:
+            return
+
+        logger.debug(f"Reloading local collection at {self.directory}.")
+        self.config = json.loads((self.directory / "collection.json").read_text())
+        self._vectors = np.lib.format.open_memmap(self.directory / "vectors.npy", mode="r+")
+        self._load()
+
+    def save_config(self) -> None:
+        if self.directory is not None:
+            (self.directory / "collection.json").write_text(json.dumps(self.config))
+            self._stamp = self._file_stamp()
+
+    @property
+    def points_count(self) -> int:
+        return len(self._slots)
+
+    def _grow(self, capacity: int) -> None:
+        if self.directory is None:
+            vectors = np.zeros((capacity, self._vectors.shape[1]), dtype=np.float32)
+            vectors[: len(self._vectors)] = self._vectors
+        else:
+            # Write the grown matrix next to the current one, then swap it in
+            grown_path = self.directory / "vectors.grow.npy"
+            vectors = np.lib.format.open_memmap(
+                grown_path, mode="w+", dtype=np.float32, shape=(capacity, self._vectors.shape[1])
+            )
+            vectors[: len(self._vectors)] = self._vectors
+            vectors.flush()
+            del vectors
+            grown_path.replace(self.directory / "vectors.npy")
+            vectors = np.lib.format.open_memmap(self.directory / "vectors.npy", mode="r+")
+
+        self._vectors = vectors
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: len(self._alive)] = self._alive
+        self._alive = alive
+        for field_name, column in self._range_indexes.items():
+            self._range_indexes[field_name] = np.concatenate([column, np.full(capacity - len(column), np.nan)])
+
+    def _allocate_slot(self) -> int:
+        if self._free:
+            return self._free.pop()
+
+        slot = len(self._ids)
+        if slot >= len(self._vectors):
+            self._grow(2 * len(self._vectors))
+        self._ids.append(None)
+        self._payloads.append(None)
+        return slot
+
+    def upsert(self, points: Iterable[PointStruct]) -> None:
+        rows = []
+        for point in points:
+            point_id = str(point.id)
+            vector = np.asarray(point.vector if point.vector is not None else [], dtype=np.float32).reshape(-1)
+            if vector.shape[0] != self._vectors.shape[1]:
+                raise ValueError(f"Vector of size {vector.shape[0]} does not fit size {self._vectors.shape[1]}.")
+            if self.config["distance"] == Distance.COSINE:
+                norm = np.linalg.norm(vector)
+                vector = vector / norm if norm else vector
+
+            slot = self._slots.get(point_id)
+            if slot is None:
+                slot = self._allocate_slot()
+            else:
+                self._unindex(slot)
+
+            payload = dict(point.payload or {})
+            self._vectors[slot] = vector
+            self._ids[slot] = point_id
+            self._payloads[slot] = payload
+            self._slots[point_id] = slot
+            self._alive[slot] = True
+            self._index(slot)
+            rows.append((point_id, slot, json.dumps(payload)))
+
+        self._points.executemany("INSERT OR REPLACE INTO points (id, slot, payload) VALUES (?, ?, ?)", rows)
+        self._points.commit()
+        if isinstance(self._vectors, np.memmap):
+            self._vectors.flush()
+        self._stamp = self._file_stamp()
+
+    def delete(self, mask: np.ndarray) -> None:
+        deleted_ids = []
+        for slot in np.flatnonzero(mask).tolist():
+            self._unindex(slot)
+            deleted_ids.append(self._ids[slot])
+            del self._slots[self._ids[slot]]
+            self._ids[slot] = None
+            self._payloads[slot] = None
+            self._alive[slot] = False
+            self._free.append(slot)
+
+        self._points.executemany("DELETE FROM points WHERE id = ?", [(point_id,) for point_id in deleted_ids])
+        self._points.commit()
+        self._stamp = self._file_stamp()
+
+    def create_index(self, field_name: str, field_schema: Any) -> None:
+        index_type = _index_type(field_schema)
+        self.config["payload_indexes"][field_name] = index_type
+        self._build_index(field_name, index_type)
+        self.save_config()
+
+    def _build_index(self, field_name: str, index_type: str) -> None:
+        if index_type in KEYWORD_INDEX_TYPES:
+            self._keyword_indexes[field_name] = {}
+        elif index_type in RANGE_INDEX_TYPES:
+            self._range_indexes[field_name] = np.full(len(self._alive), np.nan)
+        else:
+            return
+
+        for slot, payload in enumerate(self._payloads):
+            if payload is not None:
+                self._index(slot, fields=[field_name])
+
+    def _index(self, slot: int, fields: Iterable[str] | None = None) -> None:
+        payload = self._payloads[slot]
+        for field_name in fields or [*self._keyword_indexes, *self._range_indexes]:
+            value = payload.get(field_name)
+            if value is None:
+                continue
+            if field_name in self._keyword_indexes:
+                for item in _values(value):
+                    self._keyword_indexes[field_name].setdefault(item, set()).add(slot)
+            elif isinstance(value, int | float):
+                self._range_indexes[field_name][slot] = value
+
+    def _unindex(self, slot: int) -> None:
+        payload = self._payloads[slot]
+        for field_name, index in self._keyword_indexes.items():
+            for item in _values(payload.get(field_name)):
+                index.get(item, set()).discard(slot)
+        for column in self._range_indexes.values():
+            column[slot] = np.nan
+
+    def mask(self, query_filter: Filter | dict | None) -> np.ndarray:
+        """
+        Rows of the points matching ``query_filter``.
+        """
+        mask = self._alive[: len(self._ids)].copy()
+        if query_filter is None:
+            return mask
+        if isinstance(query_filter, dict):
+            query_filter = Filter.model_validate(query_filter)
+
+        return mask & self._condition_mask(query_filter)
+
+    def _condition_mask(self, condition: Any) -> np.ndarray:
+        n = len(self._ids)
+        if isinstance(condition, Filter):
+            mask = np.ones(n, dtype=bool)
+            for must in _values(condition.must or []):
+                mask &= self._condition_mask(must)
+            for must_not in _values(condition.must_not or []):
+                mask &= ~self._condition_mask(must_not)
+            if condition.should:
+                mask &= np.logical_or.reduce([self._condition_mask(should) for should in _values(condition.should)])
+            return mask
+
+        if isinstance(condition, HasIdCondition):
+            mask = np.zeros(n, dtype=bool)
+            mask[[self._slots[str(i)] for i in condition.has_id if str(i) in self._slots]] = True
+            return mask
+
+        if isinstance(condition, FieldCondition) and isinstance(condition.match, MatchValue | MatchAny):
+            values = {condition.match.value} if isinstance(condition.match, MatchValue) else set(condition.match.any)
+            mask = np.zeros(n, dtype=bool)
+            if condition.key in self._keyword_indexes:
+                index = self._keyword_indexes[condition.key]
+                mask[[slot for value in values for slot in index.get(value, ())]] = True
+            else:
+                for slot, payload in enumerate(self._payloads):
+                    if payload is not None and any(item in values for item in _values(payload.get(condition.key))):
+                        mask[slot] = True
+            return mask
+
+        if isinstance(condition, FieldCondition) and isinstance(condition.range, Range):
+            if condition.key in self._range_indexes:
+                column = self._range_indexes[condition.key][:n]
+            else:
+                column = np.array(
+                    [
+                        value if isinstance(value := (payload or {}).get(condition.key), int | float) else np.nan
+                        for payload in self._payloads
+                    ],
+                    dtype=np.float64,
+                )
+            # Comparisons with NaN are false, so points without the field never match
+            mask = ~np.isnan(column)
+            bounds = condition.range
+            if bounds.gt is not None:
+                mask &= column > bounds.gt
+            if bounds.gte is not None:
+                mask &= column >= bounds.gte
+            if bounds.lt is not None:
+                mask &= column < bounds.lt
+            if bounds.lte is not None:
+                mask &= column <= bounds.lte
+            return mask
+
+        raise ValueError(f"Filter condition not supported by the local vector store: {condition!r}")
+
+    def search(self, queries: np.ndarray, masks: list[np.ndarray], limits: list[int]) -> list[list[tuple[int, float]]]:
+        """
+        Find the best rows for each query, as (row, score) pairs sorted by score.
+
+        Queries matching most rows are scored against the whole matrix at once, selective filters only
+        score the rows they match.
+        """
+        n = len(self._ids)
+        if self.config["distance"] == Distance.COSINE:
+            queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), np.finfo(np.float32).tiny)
+
+        all_scores = None
+        results = []
+        for i, (mask, limit) in enumerate(zip(masks, limits, strict=True)):
+            candidates = np.flatnonzero(mask)
+            if 2 * len(candidates) > n:
+                if all_scores is None:
+                    all_scores = queries @ self._vectors[:n].T
+                scores = all_scores[i, candidates]
+            else:
+                scores = self._vectors[candidates] @ queries[i]
+
+            if limit <= 0:
+                top = np.arange(0)
+            elif len(candidates) > limit:
+                top = np.argpartition(-scores, limit - 1)[:limit]
+            else:
+                top = np.arange(len(candidates))
+            top = top[np.argsort(-scores[top], kind="stable")]
+            results.append([(int(candidates[j]), float(scores[j])) for j in top])
+        return results
+
+    def slot(self, point_id: str) -> int | None:
+        return self._slots.get(str(point_id))
+
+    def point_id(self, slot: int) -> str | None:
+        return self._ids[slot]
+
+    def record(self, slot: int, *, with_payload: bool | list[str], with_vectors: bool) -> dict:
+        payload = self._payloads[slot]
+        if isinstance(with_payload, list):
+            payload = {key: payload[key] for key in with_payload if key in payload}
+        return {
+            "id": self._ids[slot],
+            "payload": dict(payload) if with_payload else None,
+            "vector": self._vectors[slot].tolist() if with_vectors else None,
+        }
+
+    def info(self) -> CollectionInfo:
+        on_disk = self.config["on_disk"]
+        return CollectionInfo.model_construct(
+            status=CollectionStatus.GREEN,
+            points_count=self.points_count,
+            indexed_vectors_count=0,
+            segments_count=1,
+            config=CollectionConfig.model_construct(
+                params=CollectionParams.model_construct(
+                    vectors=VectorParams.model_construct(
+                        size=self.config["size"], distance=Distance(self.config["distance"]), on_disk=on_disk
+                    )
+                ),
+                hnsw_config=HnswConfig.model_construct(**{**DEFAULT_HNSW_CONFIG, **self.config["hnsw_config"]}),
+                quantization_config=_quantization_config.validate_python(self.config["quantization_config"]),
+            ),
+            payload_schema={
+                field_name: PayloadIndexInfo.model_construct(data_type=PayloadSchemaType(index_type), params=None)
+                for field_name, index_type in self.config["payload_indexes"].items()
+            },
+        )
+
+
+class LocalVectorStore:
+    """
+    In-process vector store implementing the part of the ``QdrantClient`` API used by ``QdrantBaseDocument``.
+
+    Search is exact, by matrix products without any network round trip or serialization, which suits the
+    corpora of a few courses. HNSW and quantization options are recorded but have no effect. With a ``path``,
+    collections are persisted to disk. Collections created by other processes are opened on first use, and
+    collections they write to are reloaded before the next request. Only one process may write at a time.
+    """
+
+    def __init__(self, path: str | Path | None = None):
+        self.path = Path(path) if path else None
+        self._collections: dict[str, _LocalCollection] = {}
+        self._lock = RLock()
+
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            for config_path in self.path.glob("*/collection.json"):
+                collection_name = config_path.parent.name
+                self._collections[collection_name] = _LocalCollection(
+                    config_path.parent, json.loads(config_path.read_text())
+                )
+            logger.info(f"Opened local vector store at {self.path} with {len(self._collections)} collections.")
+
+    def _collection(self, collection_name: str) -> _LocalCollection:
+        collection = self._collections.get(collection_name)
+        if collection is None:
+            collection = self._open(collection_name)
+        if collection is None:
+            raise _not_found(collection_name)
+
+        with collection.lock:
+            collection.refresh()
+        return collection
+
+    def _open(self, collection_name: str) -> _LocalCollection | None:
+        # The collection may have been created by another process since the store was opened
+        if self.path is None:
+            return None
+
+        config_path = self.path / collection_name / "collection.json"
+        with self._lock:
+            if collection_name not in self._collections and config_path.exists():
+                self._collections[collection_name] = _LocalCollection(
+                    config_path.parent, json.loads(config_path.read_text())
+                )
+            return self._collections.get(collection_name)
+
+    def collection_exists(self, collection_name: str) -> bool:
+        return collection_name in self._collections or self._open(collection_name) is not None
+
+    def create_collection(
+        self,
+        collection_name: str,
+        vectors_config: VectorParams | dict,
+        hnsw_config: HnswConfigDiff | None = None,
+        quantization_config: QuantizationConfig | None = None,
+        **kwargs,
+    ) -> bool:
+        if isinstance(vectors_config, dict):
+            if vectors_config:
+                raise ValueError("Named vectors are not supported by the local vector store.")
+            vectors_config = VectorParams(size=0, distance=Distance.DOT)
+
+        config = {
+            "size": vectors_config.size,
+            "distance": vectors_config.distance.value,
+            "on_disk": bool(vectors_config.on_disk),
+            "hnsw_config": hnsw_config.model_dump(exclude_none=True) if hnsw_config else {},
+            "quantization_config": quantization_config.model_dump(mode="json") if quantization_config else None,
+            "payload_indexes": {},
+        }
+        with self._lock:
+            if collection_name in self._collections:
+                return False
+
+            directory = self.path / collection_name if self.path is not None else None
+            collection = _LocalCollection(directory, config)
+            collection.save_config()
+            self._collections[collection_name] = collection
+
+        return True
+
+    def delete_collection(self, collection_name: str, **kwargs) -> bool:
+        with self._lock:
+            collection = self._collections.pop(collection_name, None)
+        if collection is not None and collection.directory is not None:
+            shutil.rmtree(collection.directory)
+
+        return collection is not None
+
+    def get_collection(self, collection_name: str) -> CollectionInfo:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            return collection.info()
+
+    def update_collection(
+        self,
+        collection_name: str,
+        vectors_config: dict[str, VectorParamsDiff] | None = None,
+        hnsw_config: HnswConfigDiff | None = None,
+        quantization_config: QuantizationConfig | None = None,
+        **kwargs,
+    ) -> bool:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            if vectors_config and "" in vectors_config and vectors_config[""].on_disk is not None:
+                collection.config["on_disk"] = vectors_config[""].on_disk
+            if hnsw_config is not None:
+                collection.config["hnsw_config"].update(hnsw_config.model_dump(exclude_none=True))
+            if quantization_config is not None:
+                collection.config["quantization_config"] = (
+                    quantization_config.model_dump(mode="json") if hasattr(quantization_config, "model_dump") else None
+                )
+            collection.save_config()
+
+        return True
+
+    def create_payload_index(self, collection_name: str, field_name: str, field_schema: Any, **kwargs) -> None:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            collection.create_index(field_name, field_schema)
+
+    def upsert(self, collection_name: str, points: Iterable[PointStruct], **kwargs) -> None:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            collection.upsert(points)
+
+    def upload_points(
+        self, collection_name: str, points: Iterable[PointStruct], batch_size: int = 64, **kwargs
+    ) -> None:
+        for batch in batched(points, batch_size):
+            self.upsert(collection_name, batch)
+
+    def delete(self, collection_name: str, points_selector: FilterSelector | PointIdsList, **kwargs) -> None:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            if isinstance(points_selector, PointIdsList):
+                query_filter = Filter(must=[HasIdCondition(has_id=points_selector.points)])
+            else:
+                query_filter = points_selector.filter
+            collection.delete(collection.mask(query_filter))
+
+    def retrieve(
+        self,
+        collection_name: str,
+        ids: list[str],
+        *,
+        with_payload: bool | list[str] = True,
+        with_vectors: bool = False,
+        **kwargs,
+    ) -> list[Record]:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            slots = [slot for slot in map(collection.slot, ids) if slot is not None]
+            return [
+                Record.model_construct(
+                    **collection.record(slot, with_payload=with_payload, with_vectors=with_vectors), shard_key=None
+                )
+                for slot in slots
+            ]
+
+    def count(self, collection_name: str, count_filter: Filter | None = None, **kwargs) -> CountResult:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            return CountResult(count=int(collection.mask(count_filter).sum()))
+
+    def scroll(
+        self,
+        collection_name: str,
+        scroll_filter: Filter | None = None,
+        limit: int = 10,
+        offset: str | None = None,
+        *,
+        with_payload: bool | list[str] = True,
+        with_vectors: bool = False,
+        **kwargs,
+    ) -> tuple[list[Record], str | None]:
+        collection = self._collection(collection_name)
+        with collection.lock:
+            # Points are scrolled in the order of their ids, like Qdrant does
+            slots = sorted(np.flatnonzero(collection.mask(scroll_filter)), key=collection.point_id)
+            ids = [collection.point_id(slot) for slot in slots]
+            start = 0 if offset is None else bisect_left(ids, str(offset))
+            records = [
+                Record.model_construct(
+                    **collection.record(slot, with_payload=with_payload, with_vectors=with_vectors), shard_key=None
+                )
+                for slot in slots[start : start + limit]
+            ]
+            next_offset = ids[start + limit] if start + limit < len(ids) else None
+
+        return records, next_offset
+
+    def query_points(
+        self,
+        collection_name: str,
+        query: Any,
+        query_filter: Filter | None = None,
+        limit: int = 10,
+        offset: int | None = None,
+        *,
+        with_payload: bool | list[str] = True,
+        with_vectors: bool = False,
+        score_threshold: float | None = None,
+        **kwargs,
+    ) -> QueryResponse:
+        request = QueryRequest.model_construct(
+            query=query,
+            filter=query_filter,
+            limit=limit,
+            offset=offset,
+            with_payload=with_payload,
+            with_vector=with_vectors,
+            score_threshold=score_threshold,
+        )
+        return self.query_batch_points(collection_name, [request])[0]
+
+    def query_batch_points(self, collection_name: str, requests: list[QueryRequest], **kwargs) -> list[QueryResponse]:
+        collection = self._collection(collection_name)
+        if not requests:
+            return []
+
+        queries = np.stack([np.asarray(request.query, dtype=np.float32).reshape(-1) for request in requests])
+        with collection.lock:
+            masks = [collection.mask(request.filter) for request in requests]
+            offsets = [request.offset or 0 for request in requests]
+            limits = [(request.limit or 10) + offset for request, offset in zip(requests, offsets, strict=True)]
+            results = collection.search(queries, masks, limits)
+
+            responses = []
+            for request, offset, hits in zip(requests, offsets, results, strict=True):
+                with_payload = True if request.with_payload is None else request.with_payload
+                points = [
+                    ScoredPoint.model_construct(
+                        **collection.record(slot, with_payload=with_payload, with_vectors=bool(request.with_vector)),
+                        version=0,
+                        score=score,
+                    )
+                    for slot, score in hits[offset:]
+                    if request.score_threshold is None or score >= request.score_threshold
+                ]
+                responses.append(QueryResponse(points=points))
+
+        return responses
+
+
+class AsyncLocalVectorStore:
+    """
+    Async facade of a ``LocalVectorStore``, standing in for ``AsyncQdrantClient``.
+
+    Calls run inline on the event loop, as local searches are cheaper than handing them to a thread.
+    """
+
+    def __init__(self, store: LocalVectorStore):
+        self._store = store
+
+    def __getattr__(self, name: str):
+        method = getattr(self._store, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+
+        return call
@@ -1,20 +1,24 @@
+import bisect
+from collections.abc import Iterator
 from pathlib import Path
 import shutil
 
 import av
-import datasets
-import imagehash
 from tqdm import tqdm
 
 from rag.domain.documents import VideoDocument
 from rag.domain.documents import VideoFrameDocument
 
+from .dedup import HashDeduplicator
+from .dedup import phash_frames
 from .utils import clean_captions
 from .utils import extract_video_frames
 
 MIN_FRAME_INTERVAL = 5000  # in milliseconds
 MAX_FRAME_INTERVAL = 10000  # in milliseconds
+FRAME_RETRY_INTERVAL = 1000  # in milliseconds, between interval candidates after a duplicate frame
 HASH_DIFF_THRESHOLD = 15
+HASH_DEDUP_WINDOW = None  # number of previously sampled frames to compare against, None for the whole video
 
 
 def get_caption_mid_frame_index(caption, fps):
@@ -26,17 +30,44 @@ def get_caption_mid_frame_index(caption, fps):
     return (start_frame + end_frame) // 2
 
 
-def process_video_frames(video):
+def sample_video_frames(video, *, progress: bool = True) -> tuple[VideoDocument, Iterator[VideoFrameDocument]]:
+    """
+    Decode a video and lazily sample its frames.
+
+    Returns the video document together with an iterator over the sampled frame documents. Frames are
+    decoded and sampled only as the iterator is consumed, and the id of every yielded frame is appended
+    to ``video_document.frame_ids``, which is therefore complete once the iterator is exhausted.
+    """
     # Initialize variables
     video_id = video["json"]["video_id"]
     title = video["json"]["title"]
     captions = clean_captions(video["json"]["captions"])
-    frame_generator = extract_video_frames(video["mp4"])
+
+    # Sampling state, shared by the sampling loop below and the timestamps requested from the decoder
+    last_sampled_time = -MAX_FRAME_INTERVAL // 2
+    current_time_ms = -FRAME_RETRY_INTERVAL
+
+    def candidate_timestamps() -> Iterator[int]:
+        # Only caption midpoints and interval frames can ever pass the sampling rules, so the decoder is asked
+        # for the earliest of those given what has been sampled so far, and skips everything in between
+        caption_times = sorted({get_caption_mid_frame_index(caption, fps) * ms_per_frame for caption in captions})
+        while True:
+            interval_time = max(last_sampled_time + MAX_FRAME_INTERVAL, current_time_ms + FRAME_RETRY_INTERVAL)
+            index = max(
+                bisect.bisect_right(caption_times, current_time_ms + ms_per_frame / 2),
+                bisect.bisect_left(caption_times, last_sampled_time + MIN_FRAME_INTERVAL),
+            )
+            target_time = min(interval_time, caption_times[index]) if index < len(caption_times) else interval_time
+            # Round down so float frame timestamps still land on the exact frame
+            yield int(target_time)
+
+    frame_generator = extract_video_frames(video["mp4"], candidate_timestamps())
     meta = next(frame_generator)
     total_frames = meta["frames"]
     fps = meta["fps"]
     height = meta["height"]
     width = meta["width"]
+    ms_per_frame = 1000 / fps
 
     # Initialize Output
     video_document = VideoDocument(
@@ -50,71 +81,68 @@ def process_video_frames(video):
         merged_caption=" ".join(caption["text"] for caption in captions),
         frame_ids=[],
     )
-    frame_documents = []
 
-    print(f"Processing video {video_id} with {total_frames} frames")
+    def frame_documents() -> Iterator[VideoFrameDocument]:
+        nonlocal last_sampled_time, current_time_ms
 
-    save_path = Path(f"frames/{video_id}")
-    if save_path.exists():
-        shutil.rmtree(save_path)
-    save_path.mkdir(parents=True, exist_ok=False)
+        print(f"Processing video {video_id} with {total_frames} frames")
 
-    # Process frames
-    # Caption-based frame indices
-    caption_frame_indices = set()
-    for caption in captions:
-        mid_index = get_caption_mid_frame_index(caption, fps)
-        caption_frame_indices.add(mid_index)
+        save_path = Path(f"frames/{video_id}")
+        if save_path.exists():
+            shutil.rmtree(save_path)
+        save_path.mkdir(parents=True, exist_ok=False)
 
-    # For fallback interval sampling
-    last_sampled_time = -MAX_FRAME_INTERVAL // 2
-    last_frame_hash = None
-    current_time_ms = 0
-    ms_per_frame = 1000 / fps
+        # Process frames
+        # Caption-based frame indices
+        caption_frame_indices = set()
+        for caption in captions:
+            mid_index = get_caption_mid_frame_index(caption, fps)
+            caption_frame_indices.add(mid_index)
 
-    for frame_idx, frame in tqdm(enumerate(frame_generator), total=total_frames):
-        assert isinstance(frame, av.VideoFrame)
-        current_time_ms = frame_idx * ms_per_frame
+        # Near-duplicate suppression against the previously sampled frames
+        deduplicator = HashDeduplicator(HASH_DIFF_THRESHOLD, window=HASH_DEDUP_WINDOW)
 
-        sample_reason = None
-        should_sample = False
+        for frame in tqdm(frame_generator, disable=not progress):
+            assert isinstance(frame, av.VideoFrame)
+            frame_idx = round(frame.time * 1000 / ms_per_frame)
+            current_time_ms = frame_idx * ms_per_frame
 
-        if frame_idx in caption_frame_indices:
-            sample_reason = "caption"
-            should_sample = True
-        elif (current_time_ms - last_sampled_time) >= MAX_FRAME_INTERVAL:
-            sample_reason = "interval"
-            should_sample = True
+            sample_reason = None
+            should_sample = False
 
-        if should_sample and (current_time_ms - last_sampled_time) >= MIN_FRAME_INTERVAL:
-            current_image = frame.to_image()
-            current_hash = imagehash.phash(current_image)
+            if frame_idx in caption_frame_indices:
+                sample_reason = "caption"
+                should_sample = True
+            elif (current_time_ms - last_sampled_time) >= MAX_FRAME_INTERVAL:
+                sample_reason = "interval"
+                should_sample = True
 
-            # Avoid redundant visuals
-            if last_frame_hash is None or abs(current_hash - last_frame_hash) > HASH_DIFF_THRESHOLD:
-                filename = f"{frame_idx:06d}_{sample_reason}.jpg"
-                current_image.save(save_path / filename)
-                last_sampled_time = current_time_ms
-                last_frame_hash = current_hash
+            if should_sample and (current_time_ms - last_sampled_time) >= MIN_FRAME_INTERVAL:
+                current_hash = phash_frames([frame])[0]
 
-                frame_document = VideoFrameDocument(
-                    video_id=video_id,
-                    frame_index=frame_idx,
-                    frame_image=current_image,
-                    frame_timestamp=int(current_time_ms),
-                )
+                # Avoid redundant visuals
+                if not deduplicator.is_duplicate(current_hash):
+                    current_image = frame.to_image()
+                    filename = f"{frame_idx:06d}_{sample_reason}.jpg"
+                    current_image.save(save_path / filename)
+                    last_sampled_time = current_time_ms
+                    deduplicator.add(current_hash)
 
-                frame_documents.append(frame_document)
-                video_document.frame_ids.append(str(frame_document.id))
+                    frame_document = VideoFrameDocument(
+                        video_id=video_id,
+                        frame_index=frame_idx,
+                        frame_image=current_image,
+                        frame_timestamp=int(current_time_ms),
+                    )
 
-    print(f"Video {video_id} processed with {len(frame_documents)} frames sampled.")
-    return video_document, frame_documents
+                    video_document.frame_ids.append(str(frame_document.id))
+                    yield frame_document
 
+        print(f"Video {video_id} processed with {len(video_document.frame_ids)} frames sampled.")
 
-if __name__ == "__main__":
-    dataset = datasets.load_dataset("aegean-ai/ai-lectures-spring-24", split="train")
+    return video_document, frame_documents()
 
-    for video in dataset:
-        video_document, frame_documents = process_video_frames(video)
-        VideoDocument.bulk_insert([video_document])
-        VideoFrameDocument.bulk_insert(frame_documents)
+
+def process_video_frames(video):
+    video_document, frame_documents = sample_video_frames(video)
+    return video_document, list(frame_documents)
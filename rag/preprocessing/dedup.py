@@ -0,0 +1,98 @@
+from collections.abc import Iterable
+
+import av
+import numpy as np
+import PIL.Image
+
+HASH_SIZE = 8
+HASH_IMAGE_SIZE = HASH_SIZE * 4
+
+# Rows of the (unnormalized) DCT-II matrix for the low frequencies kept by the hash
+_DCT = np.cos(np.pi * np.outer(np.arange(HASH_SIZE), 2 * np.arange(HASH_IMAGE_SIZE) + 1) / (2 * HASH_IMAGE_SIZE))
+
+
+def phash_arrays(pixels: np.ndarray) -> np.ndarray:
+    """
+    Compute 64-bit perceptual hashes of a batch of downscaled grayscale images.
+
+    This is the same hash as ``imagehash.phash``: the sign of the 8x8 lowest DCT frequencies against
+    their median, packed into one uint64 per image.
+
+    Args:
+        pixels: Array of shape (N, 32, 32) with the grayscale images.
+
+    Returns:
+        Array of shape (N,) with the packed hashes.
+    """
+    frequencies = (_DCT @ pixels.astype(np.float64) @ _DCT.T).reshape(len(pixels), -1)
+    bits = frequencies > np.median(frequencies, axis=1, keepdims=True)
+    return np.packbits(bits, axis=1).view(">u8").astype(np.uint64).reshape(-1)
+
+
+def phash_frames(frames: Iterable[av.VideoFrame]) -> np.ndarray:
+    """
+    Compute perceptual hashes of decoded video frames, downscaling in the decoder's scaler.
+    """
+    pixels = [
+        frame.to_ndarray(width=HASH_IMAGE_SIZE, height=HASH_IMAGE_SIZE, format="gray", interpolation="LANCZOS")
+        for frame in frames
+    ]
+    return phash_arrays(np.stack(pixels)) if pixels else np.empty(0, dtype=np.uint64)
+
+
+def phash_images(images: Iterable[PIL.Image.Image]) -> np.ndarray:
+    """
+    Compute perceptual hashes of PIL images.
+    """
+    pixels = [
+        np.asarray(image.convert("L").resize((HASH_IMAGE_SIZE, HASH_IMAGE_SIZE), PIL.Image.Resampling.LANCZOS))
+        for image in images
+    ]
+    return phash_arrays(np.stack(pixels)) if pixels else np.empty(0, dtype=np.uint64)
+
+
+def hamming_distances(hashes: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """
+    Pairwise Hamming distances between two arrays of packed hashes, of shape (len(hashes), len(others)).
+    """
+    return np.bitwise_count(np.bitwise_xor.outer(hashes, others))
+
+
+def deduplicate(hashes: np.ndarray, threshold: int, window: int | None = None) -> np.ndarray:
+    """
+    Greedily suppress near-duplicates in a sequence of hashes.
+
+    A hash is kept if it is more than ``threshold`` bits away from each of the last ``window`` kept hashes,
+    or from all kept hashes if ``window`` is None.
+
+    Returns:
+        Boolean mask of the kept hashes.
+    """
+    distances = hamming_distances(hashes, hashes)
+    keep = np.zeros(len(hashes), dtype=bool)
+    kept: list[int] = []
+    for i in range(len(hashes)):
+        recent = kept if window is None else kept[-window:]
+        if not recent or distances[i, recent].min() > threshold:
+            keep[i] = True
+            kept.append(i)
+
+    return keep
+
+
+class HashDeduplicator:
+    """
+    Incremental form of ``deduplicate`` for streams of frames, keeping the accepted hashes in a packed array.
+    """
+
+    def __init__(self, threshold: int, window: int | None = None):
+        self.threshold = threshold
+        self.window = window
+        self.hashes = np.empty(0, dtype=np.uint64)
+
+    def is_duplicate(self, hash_: np.uint64) -> bool:
+        recent = self.hashes if self.window is None else self.hashes[-self.window :]
+        return bool(recent.size) and int(np.bitwise_count(recent ^ hash_).min()) <= self.threshold
+
+    def add(self, hash_: np.uint64) -> None:
+        self.hashes = np.append(self.hashes, np.uint64(hash_))
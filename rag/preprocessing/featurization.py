@@ -1,19 +1,29 @@
+import argparse
+import hashlib
+from itertools import batched
+import json
 import re
 
-from deepmultilingualpunctuation import PunctuationModel
 from loguru import logger
-import spacy
+from qdrant_client.models import Filter
+from qdrant_client.models import HasIdCondition
 from tqdm import tqdm
 
 from ..domain.chunks import EmbeddedVideoCaptionChunk
 from ..domain.chunks import EmbeddedVideoFrameChunk
 from ..domain.documents import VideoDocument
 from ..domain.documents import VideoFrameDocument
+from ..infrastructure.bm25 import BM25Index
+from ..infrastructure.embedding_cache import CachedEmbedding
 from ..infrastructure.embeddings import BGEEmbedding
 from ..infrastructure.embeddings import Siglip2Embedding
+from ..infrastructure.response_cache import ResponseCache
+from ..settings import settings
+from .segmentation import restore_punctuation
+from .segmentation import split_sentences
 
-punctuation_model = PunctuationModel()
-spacy_sentence_split = spacy.load("en_core_web_lg")
+FEATURIZATION_VERSION = 2  # bump to re-featurize every video when chunking or embedding changes
+ALIGNMENT_LOOKAHEAD = 8  # in words, how far to look for a resynchronization point after a mismatch
 
 
 def build_word_timeline(captions):
@@ -35,36 +45,101 @@ def build_word_timeline(captions):
     return word_timeline
 
 
-def match_sentence_time(sentence_words, word_timeline):
+def _normalize_word(word: str) -> str:
+    return re.sub(r"\W", "", word.lower())
+
+
+def _words_match(a: str, b: str) -> bool:
     """
-    Finds the first exact match in the word timeline.
-    Returns (start_ms, end_ms, match_end_idx) if found, else (None, None, None)
+    Whether two normalized words are equal, or within one edit of each other for words of four letters or more.
     """
-    sentence_len = len(sentence_words)
-    timeline_words = [w["word"] for w in word_timeline]
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1 or min(len(a), len(b)) < 4:
+        return False
 
-    for i in range(len(timeline_words) - sentence_len + 1):
-        if timeline_words[i : i + sentence_len] == sentence_words:
-            return (word_timeline[i]["start_ms"], word_timeline[i + sentence_len - 1]["end_ms"], i + sentence_len - 1)
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    return a[i + 1 :] == b[i + 1 :] or a[i + 1 :] == b[i:] or a[i:] == b[i + 1 :]
 
-    return None, None, None
 
+def align_sentences(sentences_words, word_timeline, lookahead=ALIGNMENT_LOOKAHEAD):
+    """
+    Aligns consecutive sentences to the word timeline with a single cursor, in linear time.
+    Words altered, inserted or dropped by punctuation restoration are tolerated: on a mismatch, the cursor
+    resynchronizes on the nearest pair of matching words within ``lookahead`` words, and otherwise treats
+    the words as a substitution.
+    Returns (start_ms, end_ms) for each sentence, or (None, None) if the timeline is exhausted.
+    """
+    timeline_words = [_normalize_word(w["word"]) for w in word_timeline]
+    n = len(timeline_words)
 
-# Process all video documents
-docs = VideoDocument.bulk_find()
-logger.info(f"Fetched {len(docs)} video documents from the database.")
+    def anchors(words, j, cursor):
+        # Two consecutive matching words, to avoid resynchronizing on a stray common word
+        return _words_match(words[j], timeline_words[cursor]) and (
+            j + 1 >= len(words) or cursor + 1 >= n or _words_match(words[j + 1], timeline_words[cursor + 1])
+        )
+
+    cursor = 0
+    spans = []
+    for sentence_words in sentences_words:
+        words = [_normalize_word(w) for w in sentence_words]
+        words = [w for w in words if w]
+        first = last = None
+
+        j = 0
+        while j < len(words) and cursor < n:
+            if not _words_match(words[j], timeline_words[cursor]):
+                resync = next(
+                    (
+                        (skip_words, d - skip_words)
+                        for d in range(1, lookahead + 1)
+                        for skip_words in range(d + 1)
+                        if j + skip_words < len(words)
+                        and cursor + d - skip_words < n
+                        and anchors(words, j + skip_words, cursor + d - skip_words)
+                    ),
+                    None,
+                )
+                if resync is not None:
+                    skip_words, skip_timeline = resync
+                    j += skip_words
+                    cursor += skip_timeline
+                    continue
+
+            # Matching or substituted word
+            first = cursor if first is None else first
+            last = cursor
+            j += 1
+            cursor += 1
+
+        if first is None:
+            spans.append((None, None))
+        else:
+            spans.append((word_timeline[first]["start_ms"], word_timeline[last]["end_ms"]))
+
+    return spans
 
-for doc in tqdm(docs, desc="Processing video documents"):
-    caption_chunks = []
-    captions = doc.captions
 
+def segment_captions(docs: list[VideoDocument]) -> list[list[str]]:
+    """
+    Split the merged captions of videos into sentences, in batches across videos.
+    """
     # Restore punctuation to get proper sentence boundaries
-    doc.merged_caption = punctuation_model.restore_punctuation(doc.merged_caption)
+    punctuated_captions = restore_punctuation([doc.merged_caption for doc in docs])
+    return split_sentences(punctuated_captions)
+
+
+def split_caption_chunks(doc: VideoDocument, sentences: list[str]) -> list[dict]:
+    """
+    Split the captions of a video into sentence-aligned chunks with their time spans.
+    """
+    caption_chunks = []
+    captions = doc.captions
 
-    # Split into sentences, then remove punctuation to match raw captions
-    sentences = [
-        re.sub(r"[.,;:!?-]", "", sent.text.strip()) for sent in spacy_sentence_split(doc.merged_caption).sents
-    ]
+    # Remove punctuation to match raw captions
+    sentences = [re.sub(r"[.,;:!?-]", "", sentence) for sentence in sentences]
 
     # Merge sentences that are too short
     merged_sentences = []
@@ -82,14 +157,10 @@ for doc in tqdm(docs, desc="Processing video documents"):
     # Build a word-level timeline from the original captions
     word_timeline = build_word_timeline(captions)
 
-    for sentence in sentences:
-        sentence_words = [w.lower() for w in sentence.split()]
-        start_ms, end_ms, end_idx = match_sentence_time(sentence_words, word_timeline)
-
+    spans = align_sentences([sentence.split() for sentence in sentences], word_timeline)
+    for sentence, (start_ms, end_ms) in zip(sentences, spans, strict=True):
         if start_ms is None:
-            logger.warning(
-                f"Could not align sentence: {sentence} with {' '.join([word['word'] for word in word_timeline[: len(sentence_words)]])}"
-            )
+            logger.warning(f"Could not align sentence: {sentence}")
             continue
 
         caption_chunks.append(
@@ -100,11 +171,34 @@ for doc in tqdm(docs, desc="Processing video documents"):
             }
         )
 
-        word_timeline = word_timeline[end_idx + 1 :]
+    return caption_chunks
 
+
+def fingerprint(doc: VideoDocument) -> str:
+    """
+    Fingerprint of everything the chunks of a video are derived from.
+    """
+    content = {
+        "version": FEATURIZATION_VERSION,
+        "sentence_splitter": settings.SENTENCE_SPLITTER,
+        "captions": doc.captions,
+        "merged_caption": doc.merged_caption,
+        "frame_ids": doc.frame_ids,
+    }
+    return hashlib.sha256(json.dumps(content, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def featurize_captions(doc: VideoDocument, sentences: list[str]) -> list[EmbeddedVideoCaptionChunk]:
+    caption_chunks = split_caption_chunks(doc, sentences)
+
+    embeddings = CachedEmbedding(BGEEmbedding()).embed_texts(caption["text"] for caption in caption_chunks)
     embedded_chunks = []
-    for caption in tqdm(caption_chunks, desc="Creating caption chunks"):
+    for index, (caption, embedding) in enumerate(
+        tqdm(zip(caption_chunks, embeddings, strict=True), total=len(caption_chunks), desc="Creating caption chunks")
+    ):
         embedded_chunk = EmbeddedVideoCaptionChunk(
+            # Alignment can give several chunks the same span, the index keeps their ids distinct
+            id=EmbeddedVideoCaptionChunk.point_id(doc.video_id, index, caption["start_ms"], caption["end_ms"]),
             video_id=doc.video_id,
             video_title=doc.video_title,
             video_height=doc.video_height,
@@ -114,19 +208,21 @@ for doc in tqdm(docs, desc="Processing video documents"):
             content=caption["text"],
             start_ms=caption["start_ms"],
             end_ms=caption["end_ms"],
-            embedding=BGEEmbedding().embed_text(caption["text"]),
+            embedding=embedding,
         )
         embedded_chunks.append(embedded_chunk)
-    EmbeddedVideoCaptionChunk.bulk_insert(embedded_chunks)
+    return embedded_chunks
 
 
-for doc in tqdm(docs, desc="Updating video frames documents"):
-    frame_ids = doc.frame_ids
+def featurize_frames(doc: VideoDocument) -> list[EmbeddedVideoFrameChunk]:
     embedded_chunks = []
-    for frame_id in tqdm(frame_ids, desc="Creating frame chunks"):
-        frame_doc: VideoFrameDocument = VideoFrameDocument.find(_id=frame_id)
-        if frame_doc:
+    # Fetch and embed frames one batch at a time so only a batch of decoded images is held in memory
+    for frame_ids in tqdm(batched(doc.frame_ids, settings.EMBEDDING_BATCH_SIZE), desc="Creating frame chunks"):
+        frame_docs = VideoFrameDocument.find_many(frame_ids)
+        embeddings = CachedEmbedding(Siglip2Embedding()).embed_images(frame_doc.frame_image for frame_doc in frame_docs)
+        for frame_doc, embedding in zip(frame_docs, embeddings, strict=True):
             embedded_chunk = EmbeddedVideoFrameChunk(
+                id=EmbeddedVideoFrameChunk.point_id(frame_doc.id),
                 content="",
                 video_id=doc.video_id,
                 video_title=doc.video_title,
@@ -137,7 +233,88 @@ for doc in tqdm(docs, desc="Updating video frames documents"):
                 frame_id=str(frame_doc.id),
                 frame_index=frame_doc.frame_index,
                 frame_timestamp=frame_doc.frame_timestamp,
-                embedding=Siglip2Embedding().embed_image(frame_doc.frame_image),
+                embedding=embedding,
             )
             embedded_chunks.append(embedded_chunk)
-    EmbeddedVideoFrameChunk.bulk_insert(embedded_chunks)
+    return embedded_chunks
+
+
+def featurize_video(doc: VideoDocument, sentences: list[str]) -> bool:
+    """
+    Upsert the caption and frame chunks of a video, then delete its points left over from earlier runs.
+
+    Returns whether all chunks were stored.
+    """
+    # Caption uploads wait until they are applied, so that ``build_caption_index`` sees them when scrolling
+    for chunk_class, chunks, wait in (
+        (EmbeddedVideoCaptionChunk, featurize_captions(doc, sentences), True),
+        (EmbeddedVideoFrameChunk, featurize_frames(doc), None),
+    ):
+        if chunks and not chunk_class.bulk_insert(chunks, wait=wait):
+            return False
+
+        stale_chunks = chunk_class.build_filter(video_id=doc.video_id)
+        stale_chunks.must_not = [HasIdCondition(has_id=[str(chunk.id) for chunk in chunks])]
+        chunk_class.bulk_delete(stale_chunks)
+
+    return True
+
+
+def build_caption_index() -> None:
+    """
+    Rebuild the BM25 index of all caption chunks stored in Qdrant, for lexical search at retrieval time.
+    """
+    chunks, offset = [], None
+    while True:
+        batch, offset = EmbeddedVideoCaptionChunk.bulk_find(limit=1000, offset=offset)
+        chunks.extend(batch)
+        if offset is None:
+            break
+
+    BM25Index.build([str(chunk.id) for chunk in chunks], [chunk.content for chunk in chunks]).save(
+        settings.BM25_INDEX_PATH
+    )
+    logger.info(f"Indexed {len(chunks)} caption chunks for lexical search.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Embed the captions and frames of the ingested videos into Qdrant.")
+    parser.add_argument("--full", action="store_true", help="Re-featurize every video, even unchanged ones.")
+    args = parser.parse_args()
+
+    docs = VideoDocument.bulk_find()
+    logger.info(f"Fetched {len(docs)} video documents from the database.")
+    if not docs:
+        return
+
+    for chunk_class in (EmbeddedVideoCaptionChunk, EmbeddedVideoFrameChunk):
+        chunk_class.migrate_collection()
+
+    # Points of videos that were removed from the database
+    for chunk_class in (EmbeddedVideoCaptionChunk, EmbeddedVideoFrameChunk):
+        chunk_class.bulk_delete(Filter(must_not=chunk_class.build_filter(video_id=[doc.video_id for doc in docs]).must))
+
+    fingerprints = {doc.video_id: fingerprint(doc) for doc in docs}
+    changed = [doc for doc in docs if args.full or doc.feature_fingerprint != fingerprints[doc.video_id]]
+    logger.info(f"{len(changed)} of {len(docs)} videos changed since they were last featurized.")
+
+    sentences_per_doc = segment_captions(changed)
+    for doc, sentences in tqdm(
+        zip(changed, sentences_per_doc, strict=True), total=len(changed), desc="Processing video documents"
+    ):
+        if featurize_video(doc, sentences):
+            doc.update(feature_fingerprint=fingerprints[doc.video_id])
+        else:
+            logger.warning(f"Failed to featurize video {doc.video_id}, it will be retried on the next run.")
+
+    build_caption_index()
+
+    if settings.RESPONSE_CACHE_ENABLED:
+        # Cached answers were generated from the previous chunks of these videos
+        response_cache = ResponseCache()
+        removed = response_cache.video_ids() - fingerprints.keys()
+        response_cache.invalidate_videos([doc.video_id for doc in changed] + sorted(removed))
+
+
+if __name__ == "__main__":
+    main()
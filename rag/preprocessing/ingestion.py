@@ -0,0 +1,102 @@
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import as_completed
+from datetime import UTC
+from datetime import datetime
+from functools import cache
+from itertools import batched
+import json
+import multiprocessing
+import os
+from pathlib import Path
+
+import datasets
+from loguru import logger
+from tqdm import tqdm
+
+from rag.domain.documents import VideoDocument
+from rag.domain.documents import VideoFrameDocument
+from rag.settings import settings
+
+from .dataset import sample_video_frames
+
+
+@cache
+def _load_dataset(dataset_name: str) -> datasets.Dataset:
+    # Each worker opens the memory-mapped dataset itself, so only row indices cross process boundaries
+    return datasets.load_dataset(dataset_name, split="train")
+
+
+def ingest_video(dataset_name: str, index: int, batch_size: int) -> int:
+    """
+    Decode, sample and store a single video of the dataset.
+
+    Sampled frames are written to MongoDB in batches of ``batch_size`` while the video is being decoded,
+    and the video document is written last. Frames left over by an interrupted run are removed first.
+
+    Returns the number of sampled frames.
+    """
+    video_document, frame_documents = sample_video_frames(_load_dataset(dataset_name)[index], progress=False)
+
+    VideoFrameDocument.bulk_delete(video_id=video_document.video_id)
+    VideoDocument.bulk_delete(video_id=video_document.video_id)
+
+    for batch in batched(frame_documents, batch_size):
+        if not VideoFrameDocument.bulk_insert(list(batch)):
+            raise RuntimeError(f"Failed to insert frames of video {video_document.video_id}")
+
+    if not VideoDocument.bulk_insert([video_document]):
+        raise RuntimeError(f"Failed to insert video {video_document.video_id}")
+
+    return len(video_document.frame_ids)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Decode the lecture videos and store sampled frames in MongoDB.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Number of decoding processes.")
+    parser.add_argument("--batch-size", type=int, default=64, help="Number of frames per MongoDB insert.")
+    parser.add_argument(
+        "--checkpoint-dir",
+        type=Path,
+        default=Path("checkpoints/ingestion"),
+        help="Directory with one checkpoint per ingested video; ingested videos are skipped on re-runs.",
+    )
+    parser.add_argument("--dataset", default=settings.DATASET_NAME, help="HuggingFace dataset to ingest.")
+    args = parser.parse_args()
+
+    args.checkpoint_dir.mkdir(parents=True, exist_ok=True)
+    dataset = _load_dataset(args.dataset)
+    video_ids = [video_json["video_id"] for video_json in dataset.select_columns("json")["json"]]
+    pending = [
+        index for index, video_id in enumerate(video_ids) if not (args.checkpoint_dir / f"{video_id}.json").exists()
+    ]
+    logger.info(f"{len(video_ids) - len(pending)} of {len(video_ids)} videos already ingested.")
+
+    # Spawn rather than fork, so each worker opens its own MongoDB connection
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        futures = {
+            executor.submit(ingest_video, args.dataset, index, args.batch_size): video_ids[index] for index in pending
+        }
+
+        failed = 0
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Ingesting videos"):
+            video_id = futures[future]
+            try:
+                frame_count = future.result()
+            except Exception:
+                logger.exception(f"Failed to ingest video {video_id}")
+                failed += 1
+                continue
+
+            checkpoint = {"video_id": video_id, "frames": frame_count, "completed_at": datetime.now(UTC).isoformat()}
+            (args.checkpoint_dir / f"{video_id}.json").write_text(json.dumps(checkpoint))
+
+    if failed:
+        logger.warning(f"{failed} videos failed and will be retried on the next run.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+from collections.abc import Iterator
+
+from ..infrastructure.registry import lazy
+from ..infrastructure.registry import lazy_module
+from ..settings import settings
+
+deepmultilingualpunctuation = lazy_module("deepmultilingualpunctuation")
+spacy = lazy_module("spacy")
+
+# Same chunking as ``PunctuationModel.predict``
+PUNCTUATION_CHUNK_SIZE = 230  # in words
+PUNCTUATION_CHUNK_OVERLAP = 5  # in words
+
+# Components of the trained pipelines that sentence boundaries do not depend on
+UNUSED_COMPONENTS = ["tagger", "attribute_ruler", "lemmatizer", "ner"]
+
+
+def _load_punctuation_model():
+    return deepmultilingualpunctuation.PunctuationModel()
+
+
+def _load_sentence_splitter():
+    if settings.SENTENCE_SPLITTER == "sentencizer":
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        return nlp
+
+    return spacy.load(settings.SENTENCE_SPLITTER, exclude=UNUSED_COMPONENTS)
+
+
+punctuation_model = lazy("punctuation_model", _load_punctuation_model)
+sentence_splitter = lazy("sentence_splitter", _load_sentence_splitter)
+
+
+def _punctuation_chunks(words: list[str]) -> list[list[str]]:
+    if len(words) <= PUNCTUATION_CHUNK_SIZE:
+        return [words] if words else []
+
+    stride = PUNCTUATION_CHUNK_SIZE - PUNCTUATION_CHUNK_OVERLAP
+    chunks = [words[i : i + PUNCTUATION_CHUNK_SIZE] for i in range(0, len(words), stride)]
+    # The last chunk is entirely covered by the previous one
+    if len(chunks[-1]) <= PUNCTUATION_CHUNK_OVERLAP:
+        chunks.pop()
+    return chunks
+
+
+def restore_punctuation(texts: list[str], batch_size: int | None = None) -> list[str]:
+    """
+    Restore the punctuation of transcripts.
+
+    Gives the same result as ``PunctuationModel.restore_punctuation`` on each text, but the chunks of all
+    texts go through the token classification pipeline together, in batches.
+
+    Args:
+        texts: The transcripts.
+        batch_size: Number of chunks per forward pass, defaults to ``settings.PUNCTUATION_BATCH_SIZE``.
+
+    Returns:
+        The punctuated transcripts, in the order of texts.
+    """
+    batch_size = batch_size or settings.PUNCTUATION_BATCH_SIZE
+
+    words_per_text = [punctuation_model.preprocess(text) for text in texts]
+    chunks_per_text = [_punctuation_chunks(words) for words in words_per_text]
+    chunk_texts = [" ".join(chunk) for chunks in chunks_per_text for chunk in chunks]
+    results = iter(punctuation_model.pipe(chunk_texts, batch_size=batch_size))
+
+    punctuated_texts = []
+    for words, chunks in zip(words_per_text, chunks_per_text, strict=True):
+        tagged_words = []
+        for i, chunk in enumerate(chunks):
+            result = next(results)
+            assert len(" ".join(chunk)) == result[-1]["end"], "chunk size too large, text got clipped"
+            # The overlapping words are tagged by the next chunk, which sees their right context
+            overlap = 0 if i == len(chunks) - 1 else PUNCTUATION_CHUNK_OVERLAP
+
+            char_index = 0
+            result_index = 0
+            for word in chunk[: len(chunk) - overlap]:
+                char_index += len(word) + 1
+                # If any subtoken of a word is labeled as sentence end, the whole word is
+                label, score = 0, 0.0
+                while result_index < len(result) and char_index > result[result_index]["end"]:
+                    label = result[result_index]["entity"]
+                    score = result[result_index]["score"]
+                    result_index += 1
+                tagged_words.append([word, label, score])
+
+        assert len(tagged_words) == len(words)
+        punctuated_texts.append(punctuation_model.prediction_to_text(tagged_words))
+
+    return punctuated_texts
+
+
+def _windows(text: str, max_chars: int) -> Iterator[str]:
+    while len(text) > max_chars:
+        end = text.rfind(" ", 0, max_chars)
+        if end <= 0:
+            end = max_chars
+        yield text[:end]
+        text = text[end:].lstrip()
+    yield text
+
+
+def split_sentences(texts: list[str], n_process: int | None = None) -> list[list[str]]:
+    """
+    Split transcripts into sentences.
+
+    Transcripts longer than ``settings.SENTENCE_SPLIT_WINDOW_CHARS`` are cut into windows at word
+    boundaries. The sentence cut by a window boundary is stitched back together.
+
+    Args:
+        texts: The transcripts.
+        n_process: Number of processes to run the pipeline in, defaults to ``settings.SENTENCE_SPLIT_PROCESSES``.
+
+    Returns:
+        The sentences of each transcript, in the order of texts.
+    """
+    n_process = n_process or settings.SENTENCE_SPLIT_PROCESSES
+
+    windows = [
+        (text_index, window_index, window)
+        for text_index, text in enumerate(texts)
+        for window_index, window in enumerate(_windows(text, settings.SENTENCE_SPLIT_WINDOW_CHARS))
+    ]
+    docs = sentence_splitter.pipe((window for _, _, window in windows), n_process=n_process)
+
+    sentences_per_text: list[list[str]] = [[] for _ in texts]
+    for (text_index, window_index, _), doc in zip(windows, docs, strict=True):
+        sentences = sentences_per_text[text_index]
+        window_sentences = [sent.text.strip() for sent in doc.sents if sent.text.strip()]
+        if window_index > 0 and sentences and window_sentences:
+            sentences[-1] = f"{sentences[-1]} {window_sentences.pop(0)}"
+        sentences.extend(window_sentences)
+
+    return sentences_per_text
@@ -1,4 +1,7 @@
+from collections.abc import Iterable
+from collections.abc import Iterator
 import io
+from itertools import chain
 
 import av
 
@@ -53,13 +56,61 @@ def clean_captions(captions: list):
     return cleaned_captions
 
 
-def extract_video_frames(mp4_bytes: bytes):
+def extract_video_frames(mp4_bytes: bytes, timestamps_ms: Iterable[float] | None = None, *, threaded: bool = True):
+    """
+    Decode the frames of a video.
+
+    The first yielded item is a dict with the video metadata. Without ``timestamps_ms``, every frame is
+    decoded and yielded. With ``timestamps_ms``, only the first frame at or after each target timestamp
+    (in milliseconds, increasing) is yielded, and groups of pictures that contain no target are demuxed
+    but never decoded. Targets are pulled lazily, one after each yielded frame, so the caller may
+    compute the next target from the frames it has already seen.
+    """
     container = av.open(io.BytesIO(mp4_bytes))
+    stream = container.streams.video[0]
+    if threaded:
+        stream.thread_type = "AUTO"
+
     yield {
-        "fps": container.streams.video[0].average_rate,
-        "height": container.streams.video[0].height,
-        "width": container.streams.video[0].width,
+        "fps": stream.average_rate,
+        "height": stream.height,
+        "width": stream.width,
         "duration": container.duration,
-        "frames": container.streams.video[0].frames,
+        "frames": stream.frames,
     }
-    yield from container.decode(video=0)
+    if timestamps_ms is None:
+        yield from container.decode(video=0)
+    else:
+        yield from _decode_video_frames_at(container, stream, iter(timestamps_ms))
+
+
+def _decode_video_frames_at(container, stream, targets: Iterator[float]):
+    target = next(targets, None)
+    group = []
+    for packet in chain(container.demux(stream), [None]):
+        if target is None:
+            return
+
+        if packet is not None and (packet.pts is None or packet.size == 0):
+            # Skip the empty packet that signals the end of the stream, the decoder is flushed below
+            continue
+
+        # A keyframe closes the previous group of pictures, which only needs decoding if a target is before its end
+        if packet is None or (packet.is_keyframe and group):
+            if packet is None or target < float(packet.pts * packet.time_base) * 1000:
+                for pending in [*group, None] if packet is None else group:
+                    for frame in stream.decode(pending):
+                        frame_time_ms = frame.time * 1000
+                        if frame_time_ms < target:
+                            continue
+
+                        yield frame
+
+                        while target is not None and target <= frame_time_ms:
+                            target = next(targets, None)
+                        if target is None:
+                            return
+            group = []
+
+        if packet is not None:
+            group.append(packet)
@@ -1,59 +1,119 @@
+from functools import cache
+import glob
+import io
+import math
 import os
+from pathlib import Path
+import uuid
 
-import datasets
+import av
+from loguru import logger
 
-# 加载数据集
-dataset = datasets.load_dataset("aegean-ai/ai-lectures-spring-24", split="train")
+from rag.infrastructure.registry import lazy_module
+from rag.settings import settings
 
-def get_video_clip(video_id: str, start_ms: int, end_ms: int):
-    # 在数据集中查找视频
-    video_clip = None
-    for video in dataset:
-        if video["json"]["video_id"] == video_id:
-            # 提取视频剪辑
-            video_clip = video["mp4"]
+datasets = lazy_module("datasets")
 
-    # 检查是否找到视频剪辑
-    if video_clip is None:
+
+@cache
+def get_dataset() -> "datasets.Dataset":
+    return datasets.load_dataset(settings.DATASET_NAME, split="train")
+
+
+@cache
+def get_video_index() -> dict[str, int]:
+    """
+    Map each video id to its row in the dataset, reading only the json column.
+    """
+    video_jsons = get_dataset().select_columns("json")["json"]
+    return {video_json["video_id"]: index for index, video_json in enumerate(video_jsons)}
+
+
+def get_video_bytes(video_id: str) -> bytes:
+    index = get_video_index().get(video_id)
+    if index is None:
         raise ValueError(f"Video with ID {video_id} not found in the dataset.")
 
-    # 先将字节内容保存到临时文件
-    temp_file = f"./temp/temp_{video_id}.mp4"
+    return get_dataset()[index]["mp4"]
+
+
+def get_video_clip(video_id: str, start_ms: int, end_ms: int) -> tuple[str, int]:
+    """
+    Get the path of a clip of a video, cutting and caching it on first request.
+
+    The clip is cut by stream copy, so it starts at the last keyframe before ``start_ms``, and this actual start
+    is returned along with the path. Clips live in a directory bounded to ``settings.CLIP_CACHE_MAX_BYTES``,
+    evicting the least recently used clips first.
+    """
+    cache_dir = Path(settings.CLIP_CACHE_DIR)
+    # The actual start is only known once the clip is cut, so it is kept in the file name
+    clip_prefix = f"{video_id}_{start_ms}-{end_ms}@"
+
+    for clip_path in cache_dir.glob(f"{glob.escape(clip_prefix)}*.mp4"):
+        clip_start_ms = clip_path.stem.removeprefix(clip_prefix)
+        if clip_start_ms.removeprefix("-").isdigit():
+            os.utime(clip_path)
+            return str(clip_path), int(clip_start_ms)
+
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    # Write to a unique temporary file first so concurrent requests never serve a partial clip
+    temp_path = cache_dir / f"{uuid.uuid4().hex}.part"
+    try:
+        clip_start_ms = cut_video_clip(get_video_bytes(video_id), start_ms, end_ms, temp_path)
+        clip_path = cache_dir / f"{clip_prefix}{clip_start_ms}.mp4"
+        temp_path.replace(clip_path)
+    finally:
+        temp_path.unlink(missing_ok=True)
+
+    _evict_clips(cache_dir, settings.CLIP_CACHE_MAX_BYTES)
+
+    return str(clip_path), clip_start_ms
 
-    if os.path.exists(temp_file):
-        return temp_file
 
-    # 确保temp目录存在
-    os.makedirs("./temp", exist_ok=True)
+def cut_video_clip(mp4_bytes: bytes, start_ms: int, end_ms: int, output_path: Path) -> int:
+    """
+    Cut a clip by stream copy, returning the time of the video at which it starts, in milliseconds.
+    """
+    with av.open(io.BytesIO(mp4_bytes)) as source, av.open(str(output_path), "w", format="mp4") as target:
+        video = source.streams.video[0]
+        streams = [stream for stream in source.streams if stream.type in ("video", "audio")]
+        outputs = {stream.index: target.add_stream_from_template(stream) for stream in streams}
 
-    # 将视频数据写入临时文件
-    with open(temp_file, "wb") as f:
-        f.write(video_clip)
+        source.seek(int(start_ms / 1000 / video.time_base), stream=video)
 
-    return temp_file
+        clip_start = None
+        for packet in source.demux(streams):
+            if packet.dts is None or packet.pts is None:
+                continue
 
-    # try:
-    #     # 现在用文件路径加载视频
-    #     with VideoFileClip(temp_file) as clip:
-    #         # 将毫秒转换为秒
-    #         start_time = int(start_ms / 1000)
-    #         end_time = int(end_ms / 1000)
-    #         subclip_filename = f"./temp/{video_id}_clip_{start_ms}-{end_ms}.mp4"
-    #         if os.path.exists(subclip_filename):
-    #             return subclip_filename
+            if packet.stream.type == "video":
+                if packet.pts * packet.time_base * 1000 > end_ms:
+                    break
+                if clip_start is None:
+                    clip_start = packet.dts * packet.time_base
+            if clip_start is None:
+                continue
 
+            # Shift timestamps so the clip starts at zero
+            shift = int(clip_start / packet.time_base)
+            packet.pts -= shift
+            packet.dts -= shift
+            if packet.dts < 0:
+                continue
 
-    #         # 从视频中提取子剪辑
-    #         subclip = clip.subclip(max(0, start_time), min(end_time, clip.duration))
+            packet.stream = outputs[packet.stream.index]
+            target.mux(packet)
 
-    #         # 保存提取的子剪辑
-    #         subclip.write_videofile(subclip_filename, codec="libx264")
+    return start_ms if clip_start is None else math.floor(clip_start * 1000)
 
-    #         # 确保子剪辑也被关闭
-    #         subclip.close()
 
-    #         return subclip_filename
-    # finally:
-    #     # 清理临时文件
-    #     if os.path.exists(temp_file):
-    #         os.remove(temp_file)
+def _evict_clips(cache_dir: Path, max_bytes: int) -> None:
+    clips = sorted(cache_dir.glob("*.mp4"), key=lambda path: path.stat().st_mtime)
+    total_bytes = sum(clip.stat().st_size for clip in clips)
+    for clip in clips:
+        if total_bytes <= max_bytes:
+            break
+        total_bytes -= clip.stat().st_size
+        clip.unlink(missing_ok=True)
+        logger.debug(f"Evicted clip {clip} from the clip cache.")
@@ -0,0 +1,96 @@
+import os
+from pathlib import Path
+import tempfile
+import unittest
+
+from rag.infrastructure.bm25 import BM25Index
+from rag.infrastructure.bm25 import BM25IndexFile
+from rag.infrastructure.retriever import reciprocal_rank_fusion
+
+IDS = ["gradient", "network", "descent", "unrelated"]
+TEXTS = [
+    "gradient descent takes a step along the negative gradient",
+    "a neural network stacks layers",
+    "stochastic gradient descent on a neural network",
+    "the weather is sunny today",
+]
+
+
+class BM25IndexTest(unittest.TestCase):
+    def setUp(self):
+        self.index = BM25Index.build(IDS, TEXTS)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "index.npz"
+
+    def test_search_orders_by_score(self):
+        results = self.index.search("gradient descent")
+
+        assert [id for id, _ in results] == ["gradient", "descent"]
+        assert results[0][1] > results[1][1] > 0
+
+    def test_search_skips_documents_without_query_terms(self):
+        assert [id for id, _ in self.index.search("neural")] == ["network", "descent"]
+        assert self.index.search("the of a") == []
+        assert self.index.search("unknown words") == []
+
+    def test_search_limit(self):
+        full = self.index.search("gradient descent neural network")
+
+        assert len(full) == 3
+        assert self.index.search("gradient descent neural network", limit=2) == full[:2]
+        assert self.index.search("gradient descent neural network", limit=1) == full[:1]
+        assert self.index.search("gradient descent neural network", limit=3) == full
+        assert self.index.search("gradient descent neural network", limit=10) == full
+        assert self.index.search("gradient descent neural network", limit=0) == []
+
+    def test_empty_index(self):
+        index = BM25Index.build([], [])
+
+        assert len(index) == 0
+        assert index.search("gradient") == []
+
+    def test_save_and_load(self):
+        self.index.save(self.path)
+        loaded = BM25Index.load(self.path)
+
+        assert len(loaded) == len(self.index)
+        assert loaded.search("neural network layers") == self.index.search("neural network layers")
+        assert not self.path.with_suffix(".part.npz").exists()
+
+    def test_load_missing_file(self):
+        index = BM25Index.load(self.path)
+
+        assert len(index) == 0
+        assert index.search("gradient") == []
+
+    def test_index_file_reloads_when_replaced(self):
+        index_file = BM25IndexFile(self.path)
+        assert index_file.search("gradient") == []
+
+        self.index.save(self.path)
+        assert [id for id, _ in index_file.search("gradient")] == ["gradient", "descent"]
+
+        BM25Index.build(["weather"], ["the weather is sunny"]).save(self.path)
+        # The modification time may not change within the resolution of the file system
+        os.utime(self.path, ns=(0, 1))
+        assert index_file.search("gradient") == []
+        assert [id for id, _ in index_file.search("sunny")] == ["weather"]
+
+
+class ReciprocalRankFusionTest(unittest.TestCase):
+    def test_fused_order(self):
+        fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "a", "d"]], k=60)
+
+        # a: 1/61 + 1/62, c: 1/63 + 1/61, b: 1/62, d: 1/63
+        assert fused == ["a", "c", "b", "d"]
+
+    def test_single_ranking_keeps_its_order(self):
+        assert reciprocal_rank_fusion([["x", "y", "z"]], k=60) == ["x", "y", "z"]
+
+    def test_empty_rankings(self):
+        assert reciprocal_rank_fusion([[], []], k=60) == []
+
+
+if __name__ == "__main__":
+    unittest.main()
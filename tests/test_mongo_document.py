@@ -0,0 +1,94 @@
+from io import BytesIO
+import unittest
+from unittest import mock
+import uuid
+
+import PIL.Image
+
+from rag.domain.base import mongo_document
+from rag.domain.chunks import EmbeddedVideoFrameChunk
+from rag.domain.documents import VideoFrameDocument
+
+
+class FakeCollection:
+    def __init__(self, documents: list[dict]):
+        self.documents = documents
+
+    def find(self, filter_options: dict, projection: list[str] | None = None):
+        ids = filter_options["_id"]["$in"]
+        for document in self.documents:
+            if document["_id"] in ids:
+                fields = ["_id", *projection] if projection is not None else list(document)
+                yield {key: document[key] for key in fields if key in document}
+
+
+def encoded_image(color: str) -> bytes:
+    buffered = BytesIO()
+    PIL.Image.new("RGB", (4, 4), color).save(buffered, format="JPEG")
+    return buffered.getvalue()
+
+
+class FindManyTest(unittest.TestCase):
+    def setUp(self):
+        self.ids = [str(uuid.uuid4()) for _ in range(3)]
+        self.images = [encoded_image(color) for color in ("red", "green", "blue")]
+        documents = [
+            {"_id": id, "video_id": "video", "frame_index": i, "frame_image": image, "frame_timestamp": i * 1000}
+            for i, (id, image) in enumerate(zip(self.ids, self.images, strict=True))
+        ]
+        database = {VideoFrameDocument.get_collection_name(): FakeCollection(documents)}
+        patcher = mock.patch.object(mongo_document, "_database", database)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_find_many_returns_documents_in_order_of_ids(self):
+        ids = [self.ids[2], str(uuid.uuid4()), self.ids[0]]
+
+        documents = VideoFrameDocument.find_many(ids)
+
+        assert [str(document.id) for document in documents] == [self.ids[2], self.ids[0]]
+        assert [document.frame_index for document in documents] == [2, 0]
+
+    def test_find_many_with_projection(self):
+        documents = VideoFrameDocument.find_many(self.ids[:2], projection=["frame_image"])
+
+        assert [str(document.id) for document in documents] == self.ids[:2]
+        assert documents[0].frame_image.size == (4, 4)
+
+    def test_find_images_returns_stored_bytes(self):
+        images = VideoFrameDocument.find_images([self.ids[1], str(uuid.uuid4()), self.ids[0]], "frame_image")
+
+        assert images == [self.images[1], self.images[0]]
+
+    def test_frame_chunk_context(self):
+        chunks = [
+            EmbeddedVideoFrameChunk(
+                content="",
+                embedding=None,
+                video_id="video",
+                video_title="Video",
+                video_height=720,
+                video_width=1280,
+                video_fps=30,
+                video_total_frames=3,
+                frame_id=frame_id,
+                frame_index=0,
+                frame_timestamp=0,
+            )
+            for frame_id in (self.ids[1], str(uuid.uuid4()))
+        ]
+
+        assert chunks[0].to_context() == self.images[1]
+        assert EmbeddedVideoFrameChunk.bulk_to_context(chunks) == [self.images[1]]
+        error = None
+        try:
+            chunks[1].to_context()
+        except ValueError as e:
+            error = e
+
+        assert error is not None
+        assert "no longer exists" in str(error)
+
+
+if __name__ == "__main__":
+    unittest.main()
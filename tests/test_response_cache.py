@@ -0,0 +1,95 @@
+from pathlib import Path
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+
+from rag.infrastructure import response_cache
+from rag.infrastructure.response_cache import ResponseCache
+
+MODEL = "gemma3:4b"
+
+
+def embedding(*values: float) -> np.ndarray:
+    return np.array(values, dtype=np.float32)
+
+
+class ResponseCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "responses.sqlite3"
+
+        # A clock that only moves when told to, so that entries have distinct and known creation times
+        self.now = 1_000_000.0
+        patcher = mock.patch.object(response_cache, "time")
+        patcher.start().time.side_effect = lambda: self.now
+        self.addCleanup(patcher.stop)
+
+    def cache(self, **kwargs) -> ResponseCache:
+        return ResponseCache(self.path, **{"similarity": 0.9, "ttl": 3600, "max_entries": 10, **kwargs})
+
+    def put(self, cache: ResponseCache, query: str, query_embedding: np.ndarray, video_ids: list[str]) -> None:
+        cache.put(query, query_embedding, MODEL, f"answer to {query}", [f"{query} caption"], [], video_ids)
+        self.now += 1
+
+    def test_hit_within_threshold(self):
+        cache = self.cache()
+        self.put(cache, "what is a gradient", embedding(1, 0, 0), ["a"])
+        self.put(cache, "what is a network", embedding(0, 1, 0), ["b"])
+
+        response = cache.get(embedding(1, 0.2, 0), MODEL)
+
+        assert response is not None
+        assert response.query == "what is a gradient"
+        assert response.answer == "answer to what is a gradient"
+        assert response.caption_ids == ["what is a gradient caption"]
+        assert response.similarity >= 0.9
+        assert cache.get(embedding(1, 1, 0), MODEL) is None
+
+    def test_miss_when_model_differs(self):
+        cache = self.cache()
+        self.put(cache, "what is a gradient", embedding(1, 0, 0), ["a"])
+
+        assert cache.get(embedding(1, 0, 0), "another-model") is None
+        assert cache.get(embedding(1, 0, 0), MODEL) is not None
+
+    def test_ttl_expiry(self):
+        cache = self.cache(ttl=10)
+        self.put(cache, "what is a gradient", embedding(1, 0, 0), ["a"])
+
+        self.now += 5
+        assert cache.get(embedding(1, 0, 0), MODEL) is not None
+
+        self.now += 10
+        assert cache.get(embedding(1, 0, 0), MODEL) is None
+        assert self.cache(ttl=10).get(embedding(1, 0, 0), MODEL) is None
+
+    def test_eviction_at_max_entries(self):
+        cache = self.cache(max_entries=2)
+        self.put(cache, "first", embedding(1, 0, 0), ["a"])
+        self.put(cache, "second", embedding(0, 1, 0), ["b"])
+        self.put(cache, "third", embedding(0, 0, 1), ["c"])
+
+        assert cache.get(embedding(1, 0, 0), MODEL) is None
+        assert cache.get(embedding(0, 1, 0), MODEL).query == "second"
+        assert cache.get(embedding(0, 0, 1), MODEL).query == "third"
+        assert cache.video_ids() == {"b", "c"}
+
+    def test_invalidate_videos_from_another_instance(self):
+        server = self.cache()
+        self.put(server, "what is a gradient", embedding(1, 0, 0), ["a", "b"])
+        self.put(server, "what is a network", embedding(0, 1, 0), ["c"])
+        assert server.get(embedding(1, 0, 0), MODEL) is not None
+
+        featurization = self.cache()
+        assert featurization.invalidate_videos(["b"]) == 1
+
+        assert server.get(embedding(1, 0, 0), MODEL) is None
+        assert server.get(embedding(0, 1, 0), MODEL).query == "what is a network"
+        assert server.video_ids() == {"c"}
+
+
+if __name__ == "__main__":
+    unittest.main()
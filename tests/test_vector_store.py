@@ -0,0 +1,156 @@
+from pathlib import Path
+import tempfile
+import unittest
+from unittest import mock
+
+import numpy as np
+from qdrant_client.models import Filter
+from qdrant_client.models import HasIdCondition
+
+from rag.domain.base import qdrant_document
+from rag.domain.chunks import EmbeddedVideoCaptionChunk
+from rag.infrastructure.vector_store import LocalVectorStore
+
+SIZE = EmbeddedVideoCaptionChunk.Config.embedding_size
+
+
+def make_chunks() -> list[EmbeddedVideoCaptionChunk]:
+    rng = np.random.default_rng(0)
+    chunks = []
+    for i, (video_id, start_ms) in enumerate(
+        [("a", 0), ("a", 10_000), ("b", 0), ("b", 10_000), ("c", 0), ("c", 10_000)]
+    ):
+        # Nearly orthogonal vectors, so each chunk is the best match of its own vector
+        embedding = rng.normal(scale=0.01, size=SIZE).astype(np.float32)
+        embedding[i] = 1.0
+        chunks.append(
+            EmbeddedVideoCaptionChunk(
+                id=EmbeddedVideoCaptionChunk.point_id(video_id, start_ms),
+                content=f"caption {i}",
+                embedding=embedding,
+                video_id=video_id,
+                video_title=f"Video {video_id}",
+                video_height=720,
+                video_width=1280,
+                video_fps=30,
+                video_total_frames=1000,
+                start_ms=start_ms,
+                end_ms=start_ms + 5000,
+            )
+        )
+    return chunks
+
+
+class LocalVectorStoreTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name)
+        self.use_store(LocalVectorStore(self.path))
+
+        self.chunks = make_chunks()
+        assert EmbeddedVideoCaptionChunk.bulk_insert(self.chunks)
+
+    def use_store(self, store: LocalVectorStore) -> None:
+        patcher = mock.patch.object(qdrant_document, "connection", store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def ids(self, chunks: list[EmbeddedVideoCaptionChunk]) -> list[str]:
+        return [str(chunk.id) for chunk in chunks]
+
+    def test_bulk_insert(self):
+        info = EmbeddedVideoCaptionChunk.get_or_create_collection()
+
+        assert info.points_count == len(self.chunks)
+        assert set(info.payload_schema) == {"video_id", "start_ms", "end_ms"}
+
+    def test_search(self):
+        results = EmbeddedVideoCaptionChunk.search(self.chunks[3].embedding, limit=2)
+
+        assert self.ids(results)[0] == str(self.chunks[3].id)
+        assert len(results) == 2
+        assert results[0].content == "caption 3"
+        assert results[0].embedding is None
+
+    def test_search_with_keyword_filter(self):
+        results = EmbeddedVideoCaptionChunk.search(
+            self.chunks[0].embedding, limit=10, query_filter=EmbeddedVideoCaptionChunk.build_filter(video_id="b")
+        )
+
+        assert sorted(self.ids(results)) == sorted(self.ids(self.chunks[2:4]))
+
+    def test_search_with_range_filter(self):
+        results = EmbeddedVideoCaptionChunk.search(
+            self.chunks[0].embedding,
+            limit=10,
+            query_filter=EmbeddedVideoCaptionChunk.build_filter(start_ms=(5000, None)),
+        )
+
+        assert sorted(self.ids(results)) == sorted(self.ids(self.chunks[1::2]))
+
+    def test_search_batch_with_match_any_filters(self):
+        results = EmbeddedVideoCaptionChunk.search_batch(
+            [self.chunks[0].embedding, self.chunks[5].embedding],
+            limit=[1, 3],
+            query_filters=[
+                EmbeddedVideoCaptionChunk.build_filter(video_id=["a", "c"]),
+                EmbeddedVideoCaptionChunk.build_filter(video_id=["b", "c"], end_ms=(None, 5000)),
+            ],
+        )
+
+        assert self.ids(results[0]) == [str(self.chunks[0].id)]
+        assert sorted(self.ids(results[1])) == sorted(self.ids([self.chunks[2], self.chunks[4]]))
+
+    def test_find_many_keeps_order_of_ids(self):
+        ids = [str(self.chunks[4].id), str(EmbeddedVideoCaptionChunk.point_id("missing")), str(self.chunks[1].id)]
+
+        assert self.ids(EmbeddedVideoCaptionChunk.find_many(ids)) == [ids[0], ids[2]]
+
+    def test_bulk_delete_keeps_listed_ids(self):
+        stale_chunks = EmbeddedVideoCaptionChunk.build_filter(video_id="a")
+        stale_chunks.must_not = [HasIdCondition(has_id=[str(self.chunks[1].id)])]
+
+        assert EmbeddedVideoCaptionChunk.bulk_delete(stale_chunks)
+
+        remaining, _ = EmbeddedVideoCaptionChunk.bulk_find(limit=10)
+        assert sorted(self.ids(remaining)) == sorted(self.ids(self.chunks[1:]))
+
+    def test_unsupported_filter(self):
+        query_filter = Filter(must=[{"is_empty": {"key": "video_id"}}])
+        error = None
+        try:
+            EmbeddedVideoCaptionChunk.search(self.chunks[0].embedding, limit=1, query_filter=query_filter)
+        except ValueError as e:
+            error = e
+
+        assert error is not None
+        assert "not supported" in str(error)
+
+    def test_reopen_from_disk(self):
+        EmbeddedVideoCaptionChunk.bulk_delete(EmbeddedVideoCaptionChunk.build_filter(video_id="c"))
+        self.use_store(LocalVectorStore(self.path))
+
+        assert EmbeddedVideoCaptionChunk.get_or_create_collection().points_count == 4
+        results = EmbeddedVideoCaptionChunk.search(
+            self.chunks[3].embedding, limit=1, query_filter=EmbeddedVideoCaptionChunk.build_filter(start_ms=(1, None))
+        )
+        assert self.ids(results) == [str(self.chunks[3].id)]
+
+    def test_sees_writes_of_another_store(self):
+        reader = LocalVectorStore(self.path)
+        writer = LocalVectorStore(self.path)
+        self.use_store(reader)
+        assert len(EmbeddedVideoCaptionChunk.search(self.chunks[0].embedding, limit=10)) == 6
+
+        self.use_store(writer)
+        EmbeddedVideoCaptionChunk.bulk_delete(EmbeddedVideoCaptionChunk.build_filter(video_id=["a", "b"]))
+
+        self.use_store(reader)
+        assert sorted(self.ids(EmbeddedVideoCaptionChunk.search(self.chunks[0].embedding, limit=10))) == sorted(
+            self.ids(self.chunks[4:])
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()